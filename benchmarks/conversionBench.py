@@ -0,0 +1,224 @@
+# Conversion benchmark over the sample artwork in tests/ and generated svgs that
+# grow path count, vertex density, hole count and nesting depth by orders of
+# magnitude. Every file is converted by vulture.py in its own process with
+# --profile, which gives the time per stage and the vertices written; the peak
+# RSS of the process is added on systems that have os.wait4.
+#
+# usage: python benchmarks/conversionBench.py [-m b,ls,lib,ki,ki5] [-g b]
+#            [--sizes 10,100,1000] [-o results.json] [--compare old.json]
+#
+# The results file can be handed to --compare on a later run, which lists every
+# conversion that got slower by more than --threshold. For the generated files
+# the growth of the time from one size to the next is printed as an exponent:
+# 1 is linear, anything well above it is a scaling cliff
+
+import argparse
+import glob
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SCRIPT = os.path.join(ROOT, 'vulture.py')
+
+HEADER = '<svg xmlns="http://www.w3.org/2000/svg" width="100mm" height="100mm" viewBox="0 0 100 100">\n'
+
+
+def circle(cx, cy, r, sweep=1):
+    return 'M{:.4f},{:.4f} a{r:.4f},{r:.4f} 0 1,{s} {d:.4f},0 a{r:.4f},{r:.4f} 0 1,{s} {e:.4f},0 Z '.format(
+        cx - r, cy, r=r, s=sweep, d=2 * r, e=-2 * r)
+
+
+# n separate filled paths on a grid
+def manyPaths(n):
+    side = math.ceil(math.sqrt(n))
+    pitch = 100 / side
+    paths = []
+    for k in range(n):
+        x = (k % side + 0.5) * pitch
+        y = (k // side + 0.5) * pitch
+        paths.append('<path fill="black" d="' + circle(x, y, pitch * 0.4) + '"/>\n')
+    return ''.join(paths)
+
+
+# One outline whose edge is a zigzag with n teeth, so its length and with it
+# the number of sampled points grows with n
+def density(n):
+    points = []
+    for k in range(n):
+        t = 2 * math.pi * k / n
+        r = 40 if k % 2 else 38
+        points.append('{:.4f},{:.4f}'.format(50 + r * math.cos(t), 50 + r * math.sin(t)))
+    return '<path fill="black" d="M' + ' L'.join(points) + ' Z"/>\n'
+
+
+# One outline with n holes in it
+def holes(n):
+    side = math.ceil(math.sqrt(n))
+    pitch = 90 / side
+    d = 'M2,2 H98 V98 H2 Z '
+    for k in range(n):
+        x = 5 + (k % side + 0.5) * pitch
+        y = 5 + (k // side + 0.5) * pitch
+        d += circle(x, y, pitch * 0.3, 0)
+    return '<path fill="black" fill-rule="evenodd" d="' + d + '"/>\n'
+
+
+# n rings inside each other, alternately outlines and holes
+def nesting(n):
+    d = ''
+    for k in range(n):
+        d += circle(50, 50, 48 * (n - k) / n, k % 2)
+    return '<path fill="black" fill-rule="evenodd" d="' + d + '"/>\n'
+
+
+GENERATORS = {
+    'paths': manyPaths,
+    'density': density,
+    'holes': holes,
+    'depth': nesting,
+}
+
+
+def writeCorpus(directory, sizes):
+    corpus = []
+    for axis, generate in GENERATORS.items():
+        for size in sizes:
+            name = os.path.join(directory, '{}_{}.svg'.format(axis, size))
+            with open(name, 'w') as f:
+                f.write(HEADER + generate(size) + '</svg>\n')
+            corpus.append((axis, size, name))
+    return corpus
+
+
+# Convert one file in a fresh process. Returns the row for the results file
+def runConversion(svgFile, mode, extra, profileFile):
+    command = [sys.executable, SCRIPT, '-o', mode, '-stdout', '--profile', profileFile] + extra + [svgFile]
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    peakRss = None
+    if hasattr(os, 'wait4'):
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        peakRss = usage.ru_maxrss  # kB on Linux, bytes on macOS
+    else:
+        process.wait()
+    seconds = time.perf_counter() - start
+
+    row = {'mode': mode, 'seconds': seconds, 'peakRss': peakRss, 'status': process.returncode}
+    try:
+        with open(profileFile) as f:
+            record = json.loads(f.readline())
+        row['convertSeconds'] = record['seconds']
+        row['stages'] = {name: stage['seconds'] for name, stage in record['stages'].items()}
+        row['vertices'] = record['stages'].get('emit', {}).get('verticesOut', 0)
+    except (OSError, ValueError, KeyError):
+        row['error'] = 'no profile written'
+    return row
+
+
+def rowKey(row):
+    return '{} {} {}'.format(row['file'], row['mode'], ' '.join(row.get('extra', [])))
+
+
+def printRow(row):
+    if 'error' in row:
+        print('{:<28} {:>4}  {}'.format(row['file'], row['mode'], row['error']))
+        return
+    stages = row['stages']
+    print('{:<28} {:>4} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>9} {:>9}'.format(
+        row['file'], row['mode'], row['convertSeconds'], stages.get('sample', 0),
+        stages.get('simplify', 0), stages.get('unpack', 0), stages.get('emit', 0),
+        row['vertices'], row['peakRss'] if row['peakRss'] is not None else '-'))
+
+
+# log(time ratio) / log(size ratio) between neighbouring sizes of every axis
+def printScaling(rows):
+    print()
+    print('scaling exponents (1 = linear):')
+    series = {}
+    for row in rows:
+        if 'axis' in row and 'error' not in row:
+            series.setdefault((row['axis'], row['mode']), []).append((row['size'], row['convertSeconds']))
+    for (axis, mode), points in sorted(series.items()):
+        points.sort()
+        steps = []
+        for (n0, t0), (n1, t1) in zip(points, points[1:]):
+            exponent = math.log(max(t1, 1e-6) / max(t0, 1e-6)) / math.log(n1 / n0)
+            steps.append('{}->{}: {:.2f}{}'.format(n0, n1, exponent, ' !' if exponent > 1.5 else ''))
+        print('  {:<8} {:>4}  {}'.format(axis, mode, '   '.join(steps)))
+
+
+def compare(rows, oldFile, threshold):
+    with open(oldFile) as f:
+        old = {rowKey(row): row for row in json.load(f)['rows']}
+    print()
+    print('compared with ' + oldFile + ':')
+    slower = 0
+    for row in rows:
+        before = old.get(rowKey(row))
+        if before is None or 'error' in row or 'error' in before:
+            continue
+        ratio = row['convertSeconds'] / max(before['convertSeconds'], 1e-9)
+        if ratio > 1 + threshold:
+            slower += 1
+            print('  slower {:>6.2f}x  {}'.format(ratio, rowKey(row)))
+    print('  {} of {} conversions slower by more than {:.0%}'.format(slower, len(rows), threshold))
+    return slower
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='vulture.py conversion benchmark')
+    parser.add_argument('-m', dest='modes', default='b,ls,lib,ki,ki5',
+                        help='Output modes for the files in tests/')
+    parser.add_argument('-g', dest='generatedModes', default='b',
+                        help='Output modes for the generated files')
+    parser.add_argument('--sizes', dest='sizes', default='10,100,1000',
+                        help='Sizes of the generated files along every axis')
+    parser.add_argument('-x', dest='extra', default='',
+                        help='Extra vulture.py arguments for every conversion, e.g. "-f 0.01"')
+    parser.add_argument('-o', dest='output', default=None,
+                        help='Write the results to this JSON file')
+    parser.add_argument('--compare', dest='compare', default=None,
+                        help='Results file of an earlier run to compare with')
+    parser.add_argument('--threshold', dest='threshold', default=0.25, type=float,
+                        help='Slowdown reported by --compare (default: 0.25 = 25%%)')
+    args = parser.parse_args()
+
+    extra = args.extra.split()
+    sizes = [int(s) for s in args.sizes.split(',')]
+    rows = []
+
+    print('{:<28} {:>4} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9}'.format(
+        'file', 'mode', 'total s', 'sample', 'simplify', 'unpack', 'emit', 'vertices', 'peak rss'))
+
+    with tempfile.TemporaryDirectory() as directory:
+        profileFile = os.path.join(directory, 'profile.json')
+
+        for svgFile in sorted(glob.glob(os.path.join(ROOT, 'tests', '*.svg'))):
+            for mode in args.modes.split(','):
+                row = runConversion(svgFile, mode, extra, profileFile)
+                row.update({'file': os.path.basename(svgFile), 'extra': extra})
+                rows.append(row)
+                printRow(row)
+
+        for axis, size, svgFile in writeCorpus(directory, sizes):
+            for mode in args.generatedModes.split(','):
+                row = runConversion(svgFile, mode, extra, profileFile)
+                row.update({'file': os.path.basename(svgFile), 'extra': extra, 'axis': axis, 'size': size})
+                rows.append(row)
+                printRow(row)
+
+    printScaling(rows)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version, 'platform': sys.platform, 'rows': rows}, f, indent=1)
+
+    if args.compare is not None and compare(rows, args.compare, args.threshold):
+        sys.exit(1)
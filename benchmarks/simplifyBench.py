@@ -0,0 +1,50 @@
+# Compare the pure Python Simplify.js port against the NumPy simplifier
+# on large synthetic polylines
+#
+# usage: python benchmarks/simplifyBench.py [-n 1000,10000,100000] [-t 0.01]
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import vulture
+
+
+# A noisy spiral, similar to what densely sampled curved artwork looks like
+def makePolyline(n, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0, 20 * np.pi, n)
+    noise = rng.normal(scale=0.002, size=n) + 1j * rng.normal(scale=0.002, size=n)
+    return (1 + t) * np.exp(1j * t) + noise
+
+
+def timeIt(fn, *fnArgs):
+    start = time.perf_counter()
+    result = fn(*fnArgs)
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='simplify() benchmark')
+    parser.add_argument('-n', dest='sizes', default='1000,10000,100000',
+                        help='Comma separated polyline sizes')
+    parser.add_argument('-t', dest='tolerance', default=0.01, type=float,
+                        help='Simplification tolerance')
+    args = parser.parse_args()
+
+    print('{:>10} {:>4} {:>12} {:>12} {:>9} {:>8} {:>6}'.format(
+        'points', 'hq', 'python (s)', 'numpy (s)', 'speedup', 'kept', 'same'))
+
+    for n in [int(s) for s in args.sizes.split(',')]:
+        points = makePolyline(n)
+        for hq in (False, True):
+            tPy, ref = timeIt(vulture.simplify, points.tolist(), args.tolerance, hq)
+            tNp, fast = timeIt(vulture.simplifyNp, points, args.tolerance, hq)
+            same = len(ref) == len(fast) and np.allclose(np.array(ref), fast, rtol=0, atol=1e-12)
+            print('{:>10} {:>4} {:>12.4f} {:>12.4f} {:>8.1f}x {:>8} {:>6}'.format(
+                n, 'yes' if hq else 'no', tPy, tNp, tPy / tNp, len(fast), str(same)))
@@ -0,0 +1,76 @@
+# Cold start time of vulture.py: how long until --help comes back, how long a
+# full import takes, and which imports the time goes to (from python -X importtime)
+#
+# usage: python benchmarks/startupBench.py [-r 5] [-k 10] [--budget MS]
+#
+# With --budget the script exits with status 1 when the median --help start up
+# takes longer than MS milliseconds, so it can guard against import regressions
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SCRIPT = os.path.join(ROOT, 'vulture.py')
+
+
+# Median wall clock milliseconds of running python with these arguments
+def startupTime(pythonArgs, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + pythonArgs, cwd=ROOT,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+# Imports at the given nesting depth by cumulative microseconds, slowest first
+def importTimes(pythonArgs, depth):
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + pythonArgs, cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # one space, then two more for every level of nesting
+        if (len(name) - len(name.lstrip()) - 1) // 2 == depth:
+            times.append((int(cumulative), name.strip()))
+    return sorted(times, reverse=True)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='vulture.py start up benchmark')
+    parser.add_argument('-r', dest='runs', default=5, type=int,
+                        help='Runs per measurement, the median is reported')
+    parser.add_argument('-k', dest='top', default=10, type=int,
+                        help='Number of slowest imports to list')
+    parser.add_argument('--budget', dest='budget', default=None, type=float,
+                        help='Fail if the median --help start up takes longer than this many ms')
+    args = parser.parse_args()
+
+    bare = startupTime(['-c', 'pass'], args.runs)
+    helpTime = startupTime([SCRIPT, '--help'], args.runs)
+    importTime = startupTime(['-c', 'import vulture'], args.runs)
+
+    print('{:<34} {:>8.1f} ms'.format('python -c pass', bare))
+    print('{:<34} {:>8.1f} ms'.format('vulture.py --help', helpTime))
+    print('{:<34} {:>8.1f} ms'.format('import vulture (with libraries)', importTime))
+
+    # the script's own imports are top level when it runs, one level down when imported
+    for title, pythonArgs, depth in (('--help', [SCRIPT, '--help'], 0),
+                                     ('import vulture', ['-c', 'import vulture'], 1)):
+        print()
+        print('slowest imports for ' + title + ':')
+        for cumulative, name in importTimes(pythonArgs, depth)[:args.top]:
+            print('  {:<32} {:>8.1f} ms'.format(name, cumulative / 1000))
+
+    if args.budget is not None and helpTime > args.budget:
+        print()
+        print('--help took {:.1f} ms, over the {:.1f} ms budget'.format(helpTime, args.budget))
+        sys.exit(1)
@@ -1,28 +1,47 @@
-from svgpathtools import Line, QuadraticBezier, CubicBezier, Path, Arc, svg2paths2
-from svgelements import Path as elPath, Matrix
-import numpy as np
 import argparse
-import svgwrite
-import bezier #pip install bezier
+import collections
+import contextlib
+import functools
+import hashlib
+import io
+import itertools
+import json
 import math
-import subprocess
+import multiprocessing
 import os
+import pickle
 import sys
 import re
+import secrets
+import socketserver
+import threading
 import xml.etree.ElementTree as XMLET
-import shlex
 import time
+import traceback
+import tracemalloc
+
+# numpy and svgelements are most of the start up time, so a run of the script only
+# imports them once there is something to convert. --help and argument errors
+# don't wait for them. Importing this file as a module loads them straight away
+def loadLibraries():
+    global np, svgelements, elPath, Matrix, elMove, elLinear, elQuadratic, elCubic, elArc
+    import numpy as np
+    import svgelements
+    from svgelements import Path as elPath, Matrix, Move as elMove, Linear as elLinear, \
+        QuadraticBezier as elQuadratic, CubicBezier as elCubic, Arc as elArc
+
+if __name__ != '__main__':
+    loadLibraries()
 
 # Takes an x/y tuple and returns a complex number
 def tuple_to_imag(t):
     return t[0] + t[1] * 1j
 
-# Global variables (most of these are rewritten by CLI args later)
-SCALE = 1 / 90
-SUBSAMPLING = 1
-SIMPLIFY = 0.1 * SCALE
+# Simplification tolerance in mm (0.1 at the old fixed scale of 1/90) and
+# whether to skip the radial distance pass. Everything else a conversion needs
+# comes from the options of its Converter
+SIMPLIFY = 0.1 * (1 / 90)
 SIMPLIFYHQ = False
-TRACEWIDTH = '0.1'
 
 # Use Pythagoras to find the distance between two points
 def dist(a, b):
@@ -39,6 +58,30 @@ def styleParse(attr):
             i += 1
     return out
 
+# (filled, stroked) for the attributes of a path, from its fill and stroke
+# attributes or its style
+def pathPaint(attributes):
+    style = 0
+
+    if 'style' in attributes.keys():
+        style = styleParse(attributes['style'])
+
+    if 'fill' in attributes.keys():
+        filled = attributes['fill'] != 'none' and attributes['fill'] != ''
+    elif 'style' in attributes.keys():
+        filled = style['fill'] != 'none' and style['fill'] != ''
+    else:
+        filled = False
+
+    if 'stroke' in attributes.keys():
+        stroked = attributes['stroke'] != 'none' and attributes['stroke'] != ''
+    elif 'style' in attributes.keys():
+        stroked = style['stroke'] != 'none' and style['stroke'] != ''
+    else:
+        stroked = False
+
+    return filled, stroked
+
 # ray-casting algorithm based on
 # http://www.ecse.rpi.edu/Homepages/wrf/Research/Short_Notes/pnpoly.html
 def isInside(point, poly):
@@ -59,25 +102,32 @@ def isInside(point, poly):
         i += 1
     return inside
 
-
-# Shoelace Formula without absolute value which returns negative if points are CCW
-# https://stackoverflow.com/questions/14505565/detect-if-a-set-of-points-in-an-array-that-are-the-vertices-of-a-complex-polygon
-def polygonArea(poly):
-    area = 0
-    i = 0
-    while i < len(poly):
-        j = (i + 1) % len(poly)
-        area += poly[i].real * poly[j].imag
-        area -= poly[j].real * poly[i].imag
-        i += 1
-    return area / 2
-
+# Same ray cast as isInside(), but for an array of points against one ring at once.
+# Returns a bool array. Points are processed in chunks to keep the
+# points x edges intermediate arrays small
+def pointsInside(points, ring):
+    points = np.asarray(points, dtype=complex)
+    ring = np.asarray(ring, dtype=complex)
+    xi = ring.real
+    yi = ring.imag
+    xj = np.roll(xi, 1)
+    yj = np.roll(yi, 1)
+    out = np.empty(len(points), dtype=bool)
+    chunk = max(1, 1000000 // max(1, len(ring)))
+    for c in range(0, len(points), chunk):
+        x = points[c:c + chunk].real[:, None]
+        y = points[c:c + chunk].imag[:, None]
+        crosses = (yi > y) != (yj > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            xCross = (xj - xi) * (y - yi) / (yj - yi) + xi
+        out[c:c + chunk] = np.count_nonzero(crosses & (x < xCross), axis=1) % 2 == 1
+    return out
 
 # Move a small distance away from path[idxa] towards path[idxb]
-def interpPt(path, idxa, idxb):
+def interpPt(path, idxa, idxb, traceWidth):
     # a fraction of the trace width so we don't get much of a notch in the line
 
-    amt = float(TRACEWIDTH) / 8
+    amt = float(traceWidth) / 8
 
     # wrap index
     if idxb < 0:
@@ -96,100 +146,591 @@ def interpPt(path, idxa, idxb):
     return complex(a.real + (dx * amt / d), a.imag + (dy * amt / d))
 
 
+# ******************************************************************************
+#
+#   Rings
+#
+#   A polygon outline between sampling and output is a Ring: one contiguous
+#   complex128 array, so x and y sit next to each other as float64 pairs. That's
+#   16 bytes per vertex, where a list of complex numbers costs a pointer and a
+#   32 byte object for each. Area, orientation and bounding box are worked out
+#   once and kept, reversing is a view and splicing a hole in is one
+#   concatenation, so the points are never copied one at a time.
+#
+
+class Ring:
+
+    __slots__ = ('points', '_area', '_box')
+
+    def __init__(self, points, area=None, box=None):
+        self.points = np.asarray(points, dtype=complex)
+        self._area = area
+        self._box = box
+
+    def __len__(self):
+        return len(self.points)
+
+    # Shoelace formula without the absolute value, negative when the points run
+    # counter clockwise in svg coordinates (y pointing down)
+    # https://stackoverflow.com/questions/14505565/detect-if-a-set-of-points-in-an-array-that-are-the-vertices-of-a-complex-polygon
+    @property
+    def area(self):
+        if self._area is None:
+            p = self.points
+            q = np.roll(p, -1)
+            self._area = float((p.real * q.imag - q.real * p.imag).sum() / 2)
+        return self._area
+
+    # (minX, minY, maxX, maxY)
+    @property
+    def box(self):
+        if self._box is None:
+            p = self.points
+            self._box = (p.real.min(), p.imag.min(), p.real.max(), p.imag.max())
+        return self._box
+
+    # The same ring running the other way round, sharing the points
+    def reversed(self):
+        return Ring(self.points[::-1], None if self._area is None else -self._area, self._box)
+
+    # The points as a contiguous array, closed for a filled shape by repeating
+    # the first point at the end
+    def closed(self):
+        return np.concatenate((self.points, self.points[:1]))
+
+
+# Uniform grid over the vertices of a ring, used to find the closest vertex
+# pair between an outer ring and a hole without measuring every combination.
+# Vertices are kept sorted by cell key so a block of cells is a few searchsorted
+# calls, and the grid is patched in place when a hole gets spliced into the ring
+class VertexGrid:
+
+    def __init__(self, ring):
+        ring = np.asarray(ring, dtype=complex)
+        edges = np.abs(np.diff(ring))
+        self.size = edges.mean() if len(edges) and edges.mean() > 0 else 1.0
+        self.origin = complex(ring.real.min(), ring.imag.min()) if len(ring) else 0j
+        self.points = ring
+        keys = self.cellKeys(ring)
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.pos = order
+        self.index()
+
+    # cell x/y packed into a single int64 so neighbours are key + dx * 2^32 + dy
+    def cellKeys(self, points):
+        cx = np.clip(np.floor((points.real - self.origin.real) / self.size), -2**30, 2**30).astype(np.int64)
+        cy = np.clip(np.floor((points.imag - self.origin.imag) / self.size), -2**30, 2**30).astype(np.int64)
+        return cx * 2**32 + cy
+
+    # where each occupied cell starts in the sorted arrays
+    def index(self):
+        self.cells, self.cellStart, self.cellCount = np.unique(self.keys, return_index=True, return_counts=True)
+
+    # The vertex at ring position `at` was replaced by `count` new vertices, ring is the result
+    def splice(self, ring, at, count):
+        ring = np.asarray(ring, dtype=complex)
+        keep = self.pos != at
+        keys = self.keys[keep]
+        pos = self.pos[keep]
+        pos = np.where(pos > at, pos + count - 1, pos)
+        newPos = np.arange(at, at + count)
+        newKeys = self.cellKeys(ring[newPos])
+        order = np.argsort(newKeys, kind='stable')
+        insertAt = np.searchsorted(keys, newKeys[order], side='right')
+        self.keys = np.insert(keys, insertAt, newKeys[order])
+        self.pos = np.insert(pos, insertAt, newPos[order])
+        self.points = ring
+        self.index()
+
+    # Closest (ring index, path index) pair by dist(). Ties resolve to the lowest
+    # ring index, then the lowest path index, same as a nested scan would
+    def closestPair(self, path):
+        path = np.asarray(path, dtype=complex)
+        ring = self.points
+        bestD = np.full(len(path), np.inf)
+        bestA = np.full(len(path), -1)
+
+        # keep the nearest ring vertex for every path vertex in a batch of pairs,
+        # pairs always arrive grouped by path vertex
+        def measure(q, a):
+            dx = ring[a].real - path[q].real
+            dy = ring[a].imag - path[q].imag
+            d = np.sqrt(dx * dx + dy * dy)
+            firsts = np.flatnonzero(np.r_[True, q[1:] != q[:-1]])
+            group = np.cumsum(np.r_[True, q[1:] != q[:-1]]) - 1
+            minD = np.minimum.reduceat(d, firsts)
+            a = np.minimum.reduceat(np.where(d == minD[group], a, len(ring)), firsts)
+            q = q[firsts]
+            d = minD
+            better = (d < bestD[q]) | ((d == bestD[q]) & (a < bestA[q]))
+            bestD[q[better]] = d[better]
+            bestA[q[better]] = a[better]
+
+        # a few path vertices against the whole ring give an upper bound on the answer
+        sample = np.arange(0, len(path), max(1, len(path) // 8))
+        measure(np.repeat(sample, len(ring)), np.tile(np.arange(len(ring)), len(sample)))
+        bound = bestD.min()
+
+        # only vertices within the bound of the other shape's box can be part of the closest pair
+        nearRing = np.flatnonzero((ring.real >= path.real.min() - bound) & (ring.real <= path.real.max() + bound) &
+                                  (ring.imag >= path.imag.min() - bound) & (ring.imag <= path.imag.max() + bound))
+        nearPath = np.flatnonzero((path.real >= ring[nearRing].real.min() - bound) &
+                                  (path.real <= ring[nearRing].real.max() + bound) &
+                                  (path.imag >= ring[nearRing].imag.min() - bound) &
+                                  (path.imag <= ring[nearRing].imag.max() + bound))
+
+        # every pair within the bound is at most r cells apart
+        r = int(bound // self.size) + 1
+        if (2 * r + 1) ** 2 < len(nearRing):
+            steps = np.arange(-r, r + 1, dtype=np.int64)
+            offsets = (steps[:, None] * 2**32 + steps[None, :]).ravel()
+            keys = (self.cellKeys(path[nearPath])[:, None] + offsets[None, :]).ravel()
+            q = np.repeat(nearPath, len(offsets))
+            j = np.minimum(np.searchsorted(self.cells, keys), len(self.cells) - 1)
+            hit = self.cells[j] == keys
+            q = q[hit]
+            j = j[hit]
+            counts = self.cellCount[j]
+            q = np.repeat(q, counts)
+            runStart = np.repeat(self.cellStart[j] - (np.cumsum(counts) - counts), counts)
+            a = self.pos[runStart + np.arange(len(q))]
+            if len(q):
+                measure(q, a)
+        else:
+            chunk = max(1, 1000000 // max(1, len(nearRing)))
+            for c in range(0, len(nearPath), chunk):
+                q = nearPath[c:c + chunk]
+                measure(np.repeat(q, len(nearRing)), np.tile(nearRing, len(q)))
+
+        minDist = bestD.min()
+        ties = np.flatnonzero(bestD == minDist)
+        b = ties[np.lexsort((ties, bestA[ties]))[0]]
+        return int(bestA[b]), int(b)
+
+
+# Build the containment tree of a set of rings. Rings are visited from the
+# largest area down, so the last ring found to contain another is its
+# smallest container, i.e. its parent. Only rings whose bounding box holds the
+# first point are ray cast, and all of those in one vectorized call.
+# Returns (parent index or -1, nesting depth) per ring
+def nestPolys(poly, areas):
+    rings = [r.points for r in poly]
+    starts = np.array([r[0] for r in rings], dtype=complex)
+    boxArr = np.array([r.box for r in poly]).reshape(-1, 4)
+    parent = np.full(len(poly), -1)
+    depth = np.zeros(len(poly), dtype=int)
+
+    order = np.argsort(-areas, kind='stable')
+    rank = np.empty(len(poly), dtype=int)
+    rank[order] = np.arange(len(poly))
+
+    # first points sorted by x, so each box only looks at its own x range
+    byX = np.argsort(starts.real, kind='stable')
+    sortedX = starts.real[byX]
+    for k in order:
+        box = boxArr[k]
+        candidates = byX[np.searchsorted(sortedX, box[0], side='left'):np.searchsorted(sortedX, box[2], side='right')]
+        candidates = candidates[(starts.imag[candidates] >= box[1]) & (starts.imag[candidates] <= box[3]) &
+                                (rank[candidates] > rank[k])]
+        if len(candidates):
+            candidates.sort()
+            parent[candidates[pointsInside(starts[candidates], rings[k])]] = k
+
+    # parents always come earlier in the order, so depth is one pass too
+    for k in order:
+        if parent[k] >= 0:
+            depth[k] = depth[parent[k]] + 1
+
+    return parent, depth
+
+
 # Some svg paths conatin multiple nested polygons. We need to open them and splice them together.
-def unpackPoly(poly):
+# Takes point sequences or Rings, returns Rings
+def unpackPoly(poly, traceWidth, verbose=False):
     # ensure all polys are the right way around
-    if args.verbose:
-        print('...Unpacking ' + str(len(poly)) + ' Polygons')
+    if verbose:
+        print('...Unpacking ' + str(len(poly)) + ' Polygons', file=sys.stderr)
+    poly = [p if isinstance(p, Ring) else Ring(p) for p in poly]
+    areas = np.zeros(len(poly))
     p = 0
     while p < len(poly):
-        if polygonArea(poly[p]) > 0:
-            poly[p].reverse()
-            if args.verbose:
-                print('...Polygon #'+str(p)+' was backwards, reversed')
+        areas[p] = poly[p].area
+        if areas[p] > 0:
+            poly[p] = poly[p].reversed()
+            if verbose:
+                print('...Polygon #'+str(p)+' was backwards, reversed', file=sys.stderr)
         p += 1
 
-    # check for polys that are within more than 1 other poly,
-    # extract them now, then we append them later
-    # This isn't a perfect solution and only handles a single nesting
-    extraPolys = []
-    polyTmp    = []
+    parent, depth = nestPolys(poly, np.abs(areas))
+
+    # Even depths are outlines, their children are the holes that get spliced into them.
+    # Outlines come out in the order their first member appears in the path
+    children = [[] for _ in poly]
     for j in range(len(poly)):
-        c = 0
-        for k in range(len(poly)):
-            if j == k:
-                continue
-            if isInside(poly[j][0], poly[k]):
-                c += 1
-        if c > 1:
-            extraPolys.append(poly[j])
+        if parent[j] >= 0:
+            children[parent[j]].append(j)
+    outlines = [j for j in range(len(poly)) if depth[j] % 2 == 0]
+    outlines.sort(key=lambda j: min([j] + children[j]))
+
+    return [spliceHoles(poly, o, children[o], traceWidth, verbose) for o in outlines]
+
+# Splice the holes poly[h] for h in holes into the outline poly[o], every ring
+# turned the way unpackPoly() leaves them. Returns a single Ring
+def spliceHoles(poly, o, holes, traceWidth, verbose=False):
+    outerPoly = poly[o].points
+    area = poly[o].area
+    grid = None
+    for h in holes:
+        if verbose:
+            print('...Splicing polygon #' + str(h) + ' into #' + str(o), file=sys.stderr)
+        hole = poly[h].reversed()  # reverse poly
+        path = hole.points
+        area += hole.area
+
+        # find the closest pair of points to bridge the two polys,
+        # the grid is built once per outer poly and patched as holes are added
+        if grid is None:
+            grid = VertexGrid(outerPoly)
+        minOuter, minPath = grid.closestPair(path)
+
+        # splice the inner poly into the outer poly
+        # but we have to recess the two joins a little
+        # otherwise Eagle reports Invalid poly when filling
+        # the top layer
+        stubs = [interpPt(outerPoly, minOuter, minOuter - 1, traceWidth),
+                 interpPt(path, minPath, minPath + 1, traceWidth)]
+        stubsBack = [interpPt(path, minPath, minPath - 1, traceWidth),
+                     interpPt(outerPoly, minOuter, minOuter + 1, traceWidth)]
+        spliced = np.concatenate((outerPoly[0:minOuter],
+                                  [stub for stub in stubs if stub is not None],
+                                  path[minPath + 1:],
+                                  path[:minPath],
+                                  [stub for stub in stubsBack if stub is not None],
+                                  outerPoly[minOuter + 1:]))
+
+        grid.splice(spliced, minOuter, len(spliced) - len(outerPoly) + 1)
+        outerPoly = spliced
+
+    # the bridges add (next to) no area, so the outline keeps the sum
+    return Ring(outerPoly, area)
+
+# The polygons handed to the emitters: contiguous complex arrays, closed for
+# filled shapes. Rings with fewer than two points are left out
+def finishPolys(rings, filled):
+    finalPolys = []
+    for ring in rings:
+        if len(ring) < 2:
+            continue
+        if filled:
+            finalPolys.append(ring.closed())  # re-add final point so we loop around
         else:
-            polyTmp.append(poly[j])
+            finalPolys.append(np.ascontiguousarray(ring.points))
+    return finalPolys
 
-    poly = polyTmp
-    finalPolys = [poly[0]]
+#
+#
+# ******************************************************************************
+#
+#   Vectorized path sampling
+#
+#   svgelements' Path.point() searches for the right segment and evaluates it
+#   once per call. These helpers take every position along the path at once,
+#   bucket them by segment and evaluate each segment in a single NumPy pass.
+#
 
-    p = 1
-    while p < len(poly):
-        path = poly[p]
-        outerPolyIndex = 'undefined'
-        i = 0
-        while i < len(finalPolys):
-            if isInside(path[0], finalPolys[i]):
-                outerPolyIndex = i
-                break
-            elif isInside(finalPolys[i][0], path):
-                # polys in wrong order - old one is inside new one
-                t = path
-                path = finalPolys[i]
-                finalPolys[i] = t
-                outerPolyIndex = i
-                break
-            i += 1
+# An arc with a zero radius is a straight line to its end point. svgelements
+# keeps it as an Arc with both radii and the sweep 0, which goes nowhere
+def straightenArcs(segments):
+    return [elLinear(seg.start, seg.end) if isinstance(seg, elArc) and (seg.rx == 0 or seg.ry == 0) else seg
+            for seg in segments]
+
+# Evaluate one svgelements segment at an array of local t values, returns complex
+def segmentPoints(seg, t):
+    if isinstance(seg, elMove):
+        return np.full(len(t), complex(seg.end))
+    if isinstance(seg, elLinear):
+        start = complex(seg.start)
+        return start + (complex(seg.end) - start) * t
+    if isinstance(seg, elQuadratic):
+        nt = 1 - t
+        return nt * nt * complex(seg.start) + 2 * nt * t * complex(seg.control) + t * t * complex(seg.end)
+    if isinstance(seg, elCubic):
+        nt = 1 - t
+        return nt * nt * nt * complex(seg.start) + 3 * nt * nt * t * complex(seg.control1) + \
+            3 * nt * t * t * complex(seg.control2) + t * t * t * complex(seg.end)
+    # Arcs (and anything else) already have a vectorized npoint in svgelements
+    xy = np.asarray(seg.npoint(t), dtype=float).reshape(-1, 2)
+    return xy[:, 0] + 1j * xy[:, 1]
+
+GAUSS_LEGENDRE = None
+
+# 16 point Gauss-Legendre nodes and weights moved to [0, 1]. Working them out
+# takes longer than a whole path of segments, so it's done once
+def gaussLegendre():
+    global GAUSS_LEGENDRE
+    if GAUSS_LEGENDRE is None:
+        nodes, weights = np.polynomial.legendre.leggauss(16)
+        GAUSS_LEGENDRE = ((nodes + 1) / 2, weights / 2)
+    return GAUSS_LEGENDRE
+
+# Integrate speed over t from 0 to 1 for a batch of count curves at once, by
+# composite 16 point Gauss-Legendre quadrature. speed(which, t) returns the
+# speed of the curves in which at every t, one row per curve. The number of
+# pieces is doubled for the curves whose result still moves by more than
+# error (relative, or absolute below 1), which is only ever a handful: smooth
+# curves have converged at the first step, only cusps take longer
+def integrateSpeed(speed, count, error=1e-12, maxPieces=1024):
+    nodes, weights = gaussLegendre()
+
+    def estimate(which, pieces):
+        t = ((np.arange(pieces)[:, None] + nodes[None, :]) / pieces).ravel()
+        w = np.tile(weights, pieces) / pieces
+        out = np.empty(len(which))
+        chunk = max(1, 1000000 // len(t))
+        for c in range(0, len(which), chunk):
+            out[c:c + chunk] = speed(which[c:c + chunk], t) @ w
+        return out
+
+    pieces = 4
+    result = estimate(np.arange(count), pieces)
+    which = np.arange(count)
+    while len(which) and pieces < maxPieces:
+        pieces *= 2
+        finer = estimate(which, pieces)
+        moved = np.abs(finer - result[which]) > error * np.maximum(1, finer)
+        result[which] = finer
+        which = which[moved]
+    return result
+
+# Length of every segment in a path, worked out for all segments of a kind at
+# once. Lines are exact, quadratic beziers are raised to cubics, cubics and
+# elliptical arcs are integrated with integrateSpeed() and circular arcs are
+# radius times angle. These are the lengths svgelements works out one segment
+# at a time (through scipy when it's installed), to within about 1e-12
+def segmentLengths(segments):
+    lengths = np.zeros(len(segments))
+    lines = []
+    cubics = []
+    arcs = []
+    for k, seg in enumerate(segments):
+        if isinstance(seg, elMove):
+            continue
+        if isinstance(seg, elLinear):
+            lines.append((k, complex(seg.start), complex(seg.end)))
+        elif isinstance(seg, elQuadratic):
+            p0 = complex(seg.start)
+            p1 = complex(seg.control)
+            p2 = complex(seg.end)
+            cubics.append((k, p0, p0 + (p1 - p0) * 2 / 3, p2 + (p1 - p2) * 2 / 3, p2))
+        elif isinstance(seg, elCubic):
+            cubics.append((k, complex(seg.start), complex(seg.control1), complex(seg.control2), complex(seg.end)))
+        elif isinstance(seg, elArc):
+            if seg.sweep == 0:
+                continue
+            if abs(seg.rx - seg.ry) < 1e-12:
+                lengths[k] = abs(seg.rx * seg.sweep)
+            else:
+                arcs.append((k, seg.rx, seg.ry, seg.get_start_t(), seg.sweep))
+        else:
+            lengths[k] = seg.length()
+
+    if lines:
+        k, start, end = (np.array(column) for column in zip(*lines))
+        lengths[k] = np.abs(end - start)
+
+    if cubics:
+        k, p0, p1, p2, p3 = (np.array(column) for column in zip(*cubics))
+        d0 = 3 * (p1 - p0)
+        d1 = 6 * (p2 - p1)
+        d2 = 3 * (p3 - p2)
+
+        # |B'(t)|
+        def speed(which, t):
+            nt = 1 - t
+            return np.abs(d0[which, None] * (nt * nt) + d1[which, None] * (nt * t) + d2[which, None] * (t * t))
+
+        lengths[k] = integrateSpeed(speed, len(k))
+
+    if arcs:
+        k, rx, ry, t0, sweep = (np.array(column) for column in zip(*arcs))
+
+        # the ellipse is (rx cos u, ry sin u) rotated, with u running from t0 over the sweep
+        def speed(which, t):
+            u = t0[which, None] + sweep[which, None] * t
+            return np.abs(sweep[which, None]) * np.hypot(rx[which, None] * np.sin(u), ry[which, None] * np.cos(u))
+
+        lengths[k] = integrateSpeed(speed, len(k))
+
+    return lengths
+
+# Find the points at an array of global positions (0..1) along a path.
+# Positions are mapped to segments by length just like svgelements' Path.point()
+def samplePath(segments, lengths, positions):
+    positions = np.asarray(positions, dtype=float)
+    total = lengths.sum()
+    if len(segments) == 0:
+        return np.empty(0, dtype=complex)
+    if total == 0:
+        # degenerate path, every position lands on a segment start
+        idx = np.rint(positions * (len(segments) - 1)).astype(int)
+        return np.array([complex(p.real, p.imag) for p in (segments[k].point(0.0) for k in idx)])
+
+    ends = np.cumsum(lengths / total)
+    starts = np.concatenate(([0.0], ends[:-1]))
+    idx = np.minimum(np.searchsorted(ends, positions, side='left'), len(segments) - 1)
+    span = ends[idx] - starts[idx]
+    t = np.divide(positions - starts[idx], span, out=np.zeros_like(positions), where=span > 0)
+    t = np.clip(t, 0, 1)
+
+    # the ends of the path are pinned the same way Path.point() does it
+    low = positions <= 0
+    idx[low] = 0
+    t[low] = 0
+    high = positions >= 1
+    idx[high] = len(segments) - 1
+    t[high] = 1
+
+    out = np.empty(len(positions), dtype=complex)
+    order = np.argsort(idx, kind='stable')
+    bounds = np.flatnonzero(np.diff(idx[order])) + 1
+    for run in np.split(order, bounds):
+        if len(run):
+            out[run] = segmentPoints(segments[idx[run[0]]], t[run])
+    return out
 
-        if outerPolyIndex != 'undefined':
-            path.reverse()  # reverse poly
-            outerPoly = finalPolys[outerPolyIndex]
-            minDist = 10000000000
-            minOuter = 0
-            minPath = 0
-            a = 0
-            while a < len(outerPoly):
-                b = 0
-                while b < len(path):
-                    l = dist(outerPoly[a], path[b])
-                    if l < minDist:
-                        minDist = l
-                        minOuter = a
-                        minPath = b
-                    b += 1
-                a += 1
+# Split a sampled polyline wherever consecutive points jump further than maxLen
+# (that's where one subpath ends and the next one begins)
+def splitSubpaths(points, maxLen):
+    jumps = np.flatnonzero(np.abs(np.diff(points)) > maxLen) + 1
+    return np.split(points, jumps)
+
+# Number of equal pieces a segment needs so that no piece strays further
+# than tolerance from its chord. Beziers use the bound on the second
+# derivative (a piece of parameter length h deviates at most h^2 * max|B''| / 8),
+# arcs use the sagitta of the largest radius
+def flatDivisions(seg, tolerance):
+    if isinstance(seg, elLinear):
+        return 1
+    if isinstance(seg, elQuadratic):
+        dd = 2 * abs(complex(seg.start) - 2 * complex(seg.control) + complex(seg.end))
+    elif isinstance(seg, elCubic):
+        p0 = complex(seg.start)
+        p1 = complex(seg.control1)
+        p2 = complex(seg.control2)
+        p3 = complex(seg.end)
+        dd = 6 * max(abs(p0 - 2 * p1 + p2), abs(p1 - 2 * p2 + p3))
+    elif isinstance(seg, elArc):
+        r = max(seg.rx, seg.ry)
+        if r == 0:
+            return 1
+        step = 2 * math.acos(max(-1, 1 - tolerance / r))
+        return max(1, math.ceil(abs(seg.sweep) / step))
+    else:
+        return max(1, math.ceil(seg.length() / tolerance))
+    return max(1, math.ceil(math.sqrt(dd / (8 * tolerance))))
+
+# Adaptive alternative to uniform sampling: lines only contribute their end
+# points and curves are subdivided by flatness, so the point count follows the
+# shape instead of the perimeter. Returns one complex array per subpath
+def flattenPath(segments, tolerance):
+    subpaths = []
+    points = []
+    for seg in segments:
+        if isinstance(seg, elMove):
+            if len(points) > 1:
+                subpaths.append(np.concatenate(points))
+            points = [np.array([complex(seg.end)])]
+            continue
+        if not points:
+            points = [np.array([complex(seg.start)])]
+        n = flatDivisions(seg, tolerance)
+        points.append(segmentPoints(seg, np.arange(1, n + 1) / n))
+
+    if len(points) > 1:
+        subpaths.append(np.concatenate(points))
+    return subpaths
+
+#
+#
+# ******************************************************************************
+#
+#   Streaming SVG reader
+#
+#   Instead of loading the whole document up front, the file is walked with
+#   iterparse and every drawable element is handed over as soon as it closes.
+#   Finished elements are cleared and detached, so memory stays around the size
+#   of the largest single element no matter how much else is in the file.
+#
 
-                # splice the inner poly into the outer poly
-                # but we have to recess the two joins a little
-                # otherwise Eagle reports Invalid poly when filling
-                # the top layer
-            finalPolys[outerPolyIndex] = outerPoly[0:minOuter]
-            stub = interpPt(outerPoly, minOuter, minOuter - 1)
-            (finalPolys[outerPolyIndex].append(stub) if stub is not None else None)
-            stub = interpPt(path, minPath, minPath + 1)
-            (finalPolys[outerPolyIndex].append(stub) if stub is not None else None)
-            finalPolys[outerPolyIndex].extend(path[minPath + 1:])
-            finalPolys[outerPolyIndex].extend(path[:minPath])
-            stub = interpPt(path, minPath, minPath - 1)
-            (finalPolys[outerPolyIndex].append(stub) if stub is not None else None)
-            stub = interpPt(outerPoly, minOuter, minOuter + 1)
-            (finalPolys[outerPolyIndex].append(stub) if stub is not None else None)  
-            finalPolys[outerPolyIndex].extend(outerPoly[minOuter + 1:])     
-            
+# Containers whose contents are never drawn directly
+SKIPPED_TAGS = {'defs', 'metadata', 'clipPath', 'mask', 'symbol', 'marker', 'pattern', 'image', 'title', 'desc', 'style', 'script'}
+
+# Basic shapes are turned into paths by svgelements (class name, geometry attributes)
+SHAPES = {
+    'rect': ('Rect', ('x', 'y', 'width', 'height', 'rx', 'ry')),
+    'circle': ('Circle', ('cx', 'cy', 'r')),
+    'ellipse': ('Ellipse', ('cx', 'cy', 'rx', 'ry')),
+    'line': ('SimpleLine', ('x1', 'y1', 'x2', 'y2')),
+    'polyline': ('Polyline', ('points',)),
+    'polygon': ('Polygon', ('points',)),
+}
+
+# Drop the namespace from an element tag
+def localTag(tag):
+    return tag.rsplit('}', 1)[-1]
+
+# Is this element (and everything inside it) hidden
+def isHidden(attrib):
+    if attrib.get('display', '').strip() == 'none':
+        return True
+    return re.search(r'display\s*:\s*none', attrib.get('style', '')) is not None
+
+# d string for a drawable element, or None
+def elementPathD(tag, attrib):
+    if tag == 'path':
+        return attrib.get('d')
+    if tag in SHAPES:
+        shapeName, geometry = SHAPES[tag]
+        shape = getattr(svgelements, shapeName)
+        # only geometry goes in, the transform is applied later with the rest
+        values = {k: attrib[k] for k in geometry if k in attrib}
+        try:
+            return elPath(shape(values)).d()
+        except (ValueError, TypeError):
+            return None
+    return None
+
+# Walk the rest of the document, yielding (d, attributes) per drawable element
+def iterSVGPaths(events, root):
+    stack = [root]
+    skipping = 0
+    for event, elem in events:
+        if event == 'start':
+            if skipping or localTag(elem.tag) in SKIPPED_TAGS or isHidden(elem.attrib):
+                skipping += 1
+            stack.append(elem)
+            continue
+
+        stack.pop()
+        if skipping:
+            skipping -= 1
         else:
-            # not inside, just add this poly
-            finalPolys.append(path)
+            d = elementPathD(localTag(elem.tag), elem.attrib)
+            if d:
+                yield d, dict(elem.attrib)
 
-        p += 1
+        # free the element and everything it held
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
 
-    #print(finalPolys)
-    return finalPolys + extraPolys
+# Open an svg file for streaming. The root <svg> attributes (width, height, viewBox)
+# are read as soon as the root tag opens, the paths follow lazily
+def readSVG(imagePath):
+    events = XMLET.iterparse(imagePath, events=('start', 'end'))
+    event, root = next(events)
+    return dict(root.attrib), iterSVGPaths(events, root)
 
 #
 #
@@ -198,115 +739,557 @@ def unpackPoly(poly):
 #   Convert SVG paths to various EAGLE polygon formats
 #
 #
-def drawSVG(svg_attributes, attributes, paths):
+#
+#
+# ******************************************************************************
+#
+#   Output emitters
+#
+#   One class per output mode. drawSVG hands every finished polygon to the
+#   emitter, which writes it to the output stream right away
+#
 
-    global SCALE
-    global SUBSAMPLING
-    global SIMPLIFY
-    global SIMPLIFYHQ
-    global TRACEWIDTH
+# Round values to 0.01mm exactly the way '{0:.2f}'.format(round(v, 6)) would and
+# return (is negative, absolute value in hundredths). The bulk is done in NumPy;
+# values sitting right on a rounding tie go through Python's own formatting
+def hundredths(values):
+    values = np.asarray(values, dtype=float)
+    r = np.round(values, 6)
+    t = r * 100
+    q = np.rint(t).astype(np.int64)
+    neg = np.signbit(r)
+    near = np.flatnonzero(np.abs(np.abs(t - np.floor(t)) - 0.5) < 1e-3)
+    for k in near:
+        s = '{0:.2f}'.format(round(float(values[k]), 6))
+        neg[k] = s.startswith('-')
+        q[k] = int(s.replace('.', '').replace('-', ''))
+    return neg, np.abs(q)
 
-    out = ''
-    svgWidth = 0
-    svgHeight = 0
-    viewportHeight = 0
-    viewportWidth = 0
 
-    # Alert user if there are no height and width tags in the file
+class Emitter:
 
-    if 'width' not in svg_attributes.keys():
-        print("No width/height attributes found. Make sure the svg dimensions are defined in mm or in (not px/pt/pc)")
-        exit()
+    # one vertex, filled with sign, whole mm and hundredths for x then y
+    vertexFormat = ''
 
-    # Detect Viewbox dimensions if defined
-
-    if 'viewBox' in svg_attributes.keys():
-        if svg_attributes['viewBox'].split()[2] != '0':
-            viewportWidth = str(
-                round(float(svg_attributes['viewBox'].split()[2]), 2))
-            viewportHeight = str(
-                round(float(svg_attributes['viewBox'].split()[3]), 2))
-
-        svgWidth = svg_attributes['width']
-        svgHeight = svg_attributes['height']
-
-    # Convert dimensions to the proper units
-
-    if 'mm' in svgWidth:
-        svgWidth = float(svgWidth.replace('mm', ''))
-        svgHeight = float(svgHeight.replace('mm', ''))
-        viewportWidth = float(viewportWidth)
-        viewportHeight = float(viewportHeight)
-        if args.verbose:
-            print("SVG width detected in mm \\o/")
-    elif 'cm' in svgWidth:
-        svgWidth = float(svgWidth.replace('cm', '')) * 10
-        svgHeight = float(svgHeight.replace('cm', '')) * 10
-        viewportWidth = float(viewportWidth) * 10
-        viewportHeight = float(viewportHeight) * 10
-        if args.verbose:
-            print("SVG width detected in cm")        
-    elif 'in' in svgWidth:
-        svgWidth = float(svgWidth.replace('in', '')) * 25.4
-        svgHeight = float(svgHeight.replace('in', '')) * 25.4
-        viewportWidth = float(viewportWidth) * 25.4
-        viewportHeight = float(viewportHeight) * 25.4
-        if args.verbose:
-            print("SVG width detected in inches")
-    else:
-        print("SVG height/width not found. Possibly defined in illegal units?")
-        exit()
+    def __init__(self, out, exportHeight, options):
+        self.out = out
+        self.exportHeight = exportHeight
+        self.traceWidth = str(options.traceWidth)
+        self.layer = str(options.eagleLayerNumber)
+        self.signalName = options.signalName
+        self.vertexCount = 0  # vertices written so far
 
-    # Calculate scale factor (multiply by user-defined scale factor)
-    if viewportWidth != 0:
-        SCALE = (svgWidth / viewportWidth) * args.scaleFactor
-    else:
-        SCALE = 1 * args.scaleFactor
-
-    exportHeight = float(svgHeight) * SCALE
-
-    if args.outMode == "b":
-        out += "CHANGE layer " + str(args.eagleLayerNumber) + \
-            "; CHANGE rank 3; CHANGE pour solid; SET WIRE_BEND 2;\n"
-    if args.outMode == "ls":
-        out += "CHANGE layer " + str(args.eagleLayerNumber) + \
-            "; CHANGE pour solid; Grid mm; SET WIRE_BEND 2;\n"
-    if args.outMode == "ki":
-        out += "(footprint \"buzzardLabel\"\n" + \
-            " (layer \"F.Cu\")\n" + \
-            " (attr board_only exclude_from_pos_files exclude_from_bom)\n"
-    if args.outMode == "ki5":
-        out += "(module \"buzzardLabel\"" + \
-            " (layer \"F.Cu\")" + \
-            " (tedit \"" + hex(int(time.time()))[2:-1].upper() + "\")\n" + \
-            " (attr virtual)\n"
-
-    if len(paths) == 0:
-        print("No paths found. Did you use 'Object to path' in Inkscape?")
-    anyVisiblePaths = False
+    # anything that goes before the first polygon
+    def begin(self):
+        pass
+
+    # points are complex in mm, already closed for filled shapes
+    def polygon(self, points):
+        raise NotImplementedError
+
+    # anything that goes after the last polygon
+    def end(self):
+        pass
+
+    # y as written to the file, EAGLE flips it to point up
+    def outputY(self, y):
+        return self.exportHeight - y
+
+    # Render every vertex of a polygon in one go. Vertices that land on the same
+    # 0.01mm spot as the one before are dropped. Returns None if fewer than 2 are left
+    def vertexBlock(self, points):
+        points = np.asarray(points, dtype=complex)
+        negX, x = hundredths(points.real)
+        negY, y = hundredths(self.outputY(points.imag))
+        sx = np.where(negX, -x, x)
+        sy = np.where(negY, -y, y)
+        keep = np.r_[True, (sx[1:] != sx[:-1]) | (sy[1:] != sy[:-1])]
+        n = int(keep.sum())
+        if n < 2:
+            return None
+        self.vertexCount += n
+
+        fields = np.empty((n, 6), dtype=object)
+        fields[:, 0] = np.where(negX[keep], '-', '')
+        fields[:, 1] = x[keep] // 100
+        fields[:, 2] = x[keep] % 100
+        fields[:, 3] = np.where(negY[keep], '-', '')
+        fields[:, 4] = y[keep] // 100
+        fields[:, 5] = y[keep] % 100
+        return (self.vertexFormat * n) % tuple(fields.ravel().tolist())
 
-    i = 0
-    while i < len(paths):
-
-        if args.verbose:
-            print('Translating Path ' + str(i+1) + ' of ' + str(len(paths)))
-
-        # Apply the tranform from this svg object to actually transform the points
-        # We need the Matrix object from svgelements but we can only matrix multiply with
-        # svgelements' version of the Path object so we're gonna do some dumb stuff
-        # to launder the Path object from svgpathtools through a d-string into 
-        # svgelements' version of Path. Luckily, the Path object from svgelements has 
-        # backwards compatible .point methods
-        pathTransform = Matrix('')
-        if 'transform' in attributes[i].keys():
-            pathTransform = Matrix(attributes[i]['transform'])
-            if args.verbose:
-                print('...Applying Transforms')
-        path = elPath(paths[i].d()) * pathTransform
-        path = elPath(path.d())
+
+# EAGLE board script (-o b)
+class BoardScriptEmitter(Emitter):
+
+    vertexFormat = '(%s%d.%02dmm %s%d.%02dmm) '
+
+    def begin(self):
+        self.out.write("CHANGE layer " + self.layer + "; CHANGE rank 3; CHANGE pour solid; SET WIRE_BEND 2;\n")
+
+    def prefix(self):
+        return "polygon " + self.signalName + " " + self.traceWidth + "mm "
+
+    def polygon(self, points):
+        block = self.vertexBlock(points)
+        if block is not None:
+            self.out.write(self.prefix() + block + ';\n')
+
+
+# EAGLE library script (-o ls)
+class LibraryScriptEmitter(BoardScriptEmitter):
+
+    def begin(self):
+        self.out.write("CHANGE layer " + self.layer + "; CHANGE pour solid; Grid mm; SET WIRE_BEND 2;\n")
+
+    def prefix(self):
+        return "polygon " + self.traceWidth + "mm "
+
+
+# <polygon> elements for a package in an EAGLE library (-o lib)
+class LibraryPackageEmitter(Emitter):
+
+    vertexFormat = '<vertex x="%s%d.%02d" y="%s%d.%02d"/>\n'
+
+    def polygon(self, points):
+        block = self.vertexBlock(points)
+        if block is not None:
+            self.out.write("<polygon width=\"" + self.traceWidth + "\" layer=\"" + self.layer + "\">\n" +
+                           block + "</polygon>\n")
+
+
+# KiCad v6 footprint (-o ki)
+class KicadEmitter(Emitter):
+
+    vertexFormat = ' (xy %s%d.%02d %s%d.%02d)'
+    polyEnd = ") (layer \"F.SilkS\") (width 0.01) (fill solid))\n"
+
+    # KiCad keeps y pointing down
+    def outputY(self, y):
+        return y - self.exportHeight
+
+    def begin(self):
+        self.out.write("(footprint \"buzzardLabel\"\n" +
+                       " (layer \"F.Cu\")\n" +
+                       " (attr board_only exclude_from_pos_files exclude_from_bom)\n")
+
+    def polygon(self, points):
+        block = self.vertexBlock(points)
+        if block is not None:
+            self.out.write(" (fp_poly (pts" + block + self.polyEnd + '\n')
+
+    def end(self):
+        self.out.write(')\n')
+
+
+# KiCad v5 footprint (-o ki5)
+class Kicad5Emitter(KicadEmitter):
+
+    polyEnd = ") (layer \"F.SilkS\") (width 0.01))\n"
+
+    def begin(self):
+        self.out.write("(module \"buzzardLabel\"" +
+                       " (layer \"F.Cu\")" +
+                       " (tedit \"" + hex(int(time.time()))[2:-1].upper() + "\")\n" +
+                       " (attr virtual)\n")
+
+
+EMITTERS = {
+    'b': BoardScriptEmitter,
+    'ls': LibraryScriptEmitter,
+    'lib': LibraryPackageEmitter,
+    'ki': KicadEmitter,
+    'ki5': Kicad5Emitter,
+}
+
+# ******************************************************************************
+#
+#   Shape memo
+#
+#   Text turned into paths, pin markers and logo tiles repeat the same path over
+#   and over. The finished rings of every path are kept here, so a repeat only has
+#   its translation added
+#
+
+SCRIPT_HASH = None
+
+# sha256 of this script. What another version of it saved to disk is never used
+def scriptHash():
+    global SCRIPT_HASH
+    if SCRIPT_HASH is None:
+        with open(__file__, 'rb') as f:
+            SCRIPT_HASH = hashlib.sha256(f.read()).digest()
+    return SCRIPT_HASH
+
+# Same path data written with other separators or spacing gives the same key
+def normalizePathD(d):
+    return ' '.join(d.replace(',', ' ').split())
+
+class ShapeMemo:
+
+    def __init__(self, maxEntries=4096):
+        self.maxEntries = maxEntries
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.added = False
+        self.fresh = None  # shapes put since collectFresh(), while collecting them
+        # a memo can be shared by converters running in different threads
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            polys = self.entries.get(key)
+            if polys is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            return polys
+
+    def put(self, key, polys):
+        with self.lock:
+            self.entries[key] = polys
+            self.added = True
+            if self.fresh is not None:
+                self.fresh[key] = polys
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+
+    # Keep the shapes that get put from now on, so a pool worker can hand them
+    # back. takeFresh() returns them and stops
+    def collectFresh(self):
+        with self.lock:
+            self.fresh = {}
+
+    def takeFresh(self):
+        with self.lock:
+            fresh = self.fresh or {}
+            self.fresh = None
+        return fresh
+
+    def stats(self):
+        return "Shape memo: %d hits, %d misses, %d shapes kept" % (self.hits, self.misses, len(self.entries))
+
+    # The persistent layer is a single pickle of the shapes and the script that
+    # made them. Anything unreadable or made by another version just starts empty
+    def load(self, file):
+        try:
+            with open(file, 'rb') as f:
+                saved = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            saved = None
+        if isinstance(saved, dict) and saved.get('script') == scriptHash():
+            self.entries.update(saved['shapes'])
+        while len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+
+    # Merged with whatever another process saved meanwhile, then swapped in whole
+    def save(self, file):
+        if not self.added:
+            return
+        saved = ShapeMemo(self.maxEntries)
+        saved.load(file)
+        with self.lock:
+            entries = list(self.entries.items())
+        for key, polys in entries:
+            saved.put(key, polys)
+        partial = file + '.' + str(os.getpid()) + '.part'
+        with open(partial, 'wb') as f:
+            pickle.dump({'script': scriptHash(), 'shapes': saved.entries}, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(partial, file)
+        self.added = False
+
+SHAPE_MEMO = None
+SHAPE_MEMO_FILE = None  # the --shape-cache SHAPE_MEMO was loaded from
+
+# The command line's memo, loaded from the --shape-cache of options the first
+# time it's needed. It lives as long as the process, so the conversion server
+# keeps it warm. A request with another --shape-cache starts over with a memo
+# loaded from that one
+def shapeMemo(options):
+    global SHAPE_MEMO, SHAPE_MEMO_FILE
+    file = os.path.abspath(options.shapeCache) if options.shapeCache is not None else None
+    if SHAPE_MEMO is None or file != SHAPE_MEMO_FILE:
+        SHAPE_MEMO = ShapeMemo()
+        SHAPE_MEMO_FILE = file
+        if file is not None:
+            SHAPE_MEMO.load(file)
+    return SHAPE_MEMO
+
+
+# Paths handed to a worker at a time, and chunks kept in flight per worker
+PATH_CHUNK = 32
+PATH_CHUNKS_AHEAD = 2
+
+# Worker side of -p: polygons for a chunk of (d, attributes), one entry per path,
+# what was recorded while profiling and the shapes added to the worker's memo.
+# The scale belongs to the document being drawn, so it travels with the chunk
+def chunkPolygons(chunk, placement, scale, profiling):
+    profile = None
+    if profiling:
+        profile = Profile()
+        if WORKER_CONVERTER.options.profileMemory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+    WORKER_CONVERTER.memo.collectFresh()
+    results = []
+    for d, attributes in chunk:
+        if profile is not None:
+            profile.beginPath()
+        results.append(WORKER_CONVERTER.pathPolygons(d, attributes, placement, scale, profile))
+    return results, (profile.data() if profile is not None else None), WORKER_CONVERTER.memo.takeFresh()
+
+# Same results as calling pathPolygons on each path in turn, but worked out in a
+# process pool. Only a few chunks per worker are queued at once, so the svg is
+# still read as it's needed, and the results are handed back in document order.
+# The shapes the workers work out go into memo, which --shape-cache is saved from
+def parallelPathPolygons(paths, placement, scale, options, memo, profile=None):
+    jobs = options.pathJobs
+    if profile is not None:
+        paths = profiledPaths(paths, profile)  # parsing happens here, not in the workers
+    paths = iter(paths)
+    pending = collections.deque()
+    with multiprocessing.Pool(jobs, initWorker, (options,)) as pool:
+        while True:
+            while len(pending) < jobs * PATH_CHUNKS_AHEAD:
+                chunk = []
+                records = []
+                for item in itertools.islice(paths, PATH_CHUNK):
+                    chunk.append(item)
+                    records.append(profile.current if profile is not None else None)
+                if not chunk:
+                    break
+                pending.append((pool.apply_async(chunkPolygons, (chunk, placement, scale, profile is not None)),
+                                records))
+            if not pending:
+                break
+            job, records = pending.popleft()
+            results, recorded, fresh = job.get()
+            for key, polys in fresh.items():
+                memo.put(key, polys)
+            if profile is not None:
+                profile.merge(recorded, records)
+            for polys, record in zip(results, records):
+                if profile is not None:
+                    profile.current = record  # so emitting counts towards this path
+                yield polys
+
+
+# ******************************************************************************
+#
+#   Profiling
+#
+#   --profile FILE writes one JSON line per converted document: wall time, calls
+#   and the segments or vertices in and out for every stage, in total and per
+#   path. With
+#   --profile-memory the peak memory of each stage is added too. That comes from
+#   tracemalloc, which slows everything down, so it's only on when asked for
+#
+
+PROFILE_STAGES = ('parse', 'transform', 'length', 'sample', 'simplify', 'unpack', 'emit')
+
+class Profile:
+
+    def __init__(self):
+        self.stages = {}
+        self.paths = []
+        self.current = None  # record of the path being worked on
+
+    # a new per path record, that stages are counted into until the next one
+    def beginPath(self):
+        self.current = {'index': len(self.paths), 'stages': {}}
+        self.paths.append(self.current)
+
+    def note(self, name, value):
+        if self.current is not None:
+            self.current[name] = value
+
+    # counts are named for what they count, segmentsIn, verticesOut and so on, so a
+    # stage that turns segments into points doesn't pass one off as the other
+    @contextlib.contextmanager
+    def stage(self, name, **counts):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            recorded = dict(counts, calls=1, seconds=time.perf_counter() - start,
+                            peakBytes=tracemalloc.get_traced_memory()[1] - base if tracing else None)
+            self.add(self.stages, name, recorded)
+            if self.current is not None:
+                self.add(self.current['stages'], name, recorded)
+
+    @staticmethod
+    def add(stages, name, recorded):
+        totals = stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'peakBytes': None})
+        for key, value in recorded.items():
+            if value is None:
+                continue
+            if key == 'peakBytes':
+                totals[key] = max(totals[key] or 0, value)
+            else:
+                totals[key] = totals.get(key, 0) + value
+
+    # Add what a pool worker recorded to the records its paths were read into
+    def merge(self, data, records):
+        stages, paths = data
+        for name, totals in stages.items():
+            self.add(self.stages, name, totals)
+        for record, worked in zip(records, paths):
+            for name, totals in worked.pop('stages').items():
+                self.add(record['stages'], name, totals)
+            del worked['index']
+            record.update(worked)
+
+    def data(self):
+        return self.stages, self.paths
+
+# A stage of profile, or nothing at all when there's no profile
+def profileStage(profile, name, **counts):
+    if profile is None:
+        return contextlib.nullcontext({})
+    return profile.stage(name, **counts)
+
+# Pull paths from the svg, timing the parsing and starting a record for each path
+def profiledPaths(paths, profile):
+    paths = iter(paths)
+    while True:
+        profile.beginPath()
+        with profile.stage('parse'):
+            item = next(paths, None)
+        if item is None:
+            profile.paths.pop()
+            profile.current = None
+            return
+        yield item
+
+
+# The svg doesn't say how big it is in units we can turn into mm
+class SVGSizeError(ValueError):
+    pass
+
+# ******************************************************************************
+#
+#   Converter
+#
+#   Everything a conversion depends on lives on a Converter: its options, its
+#   shape memo and the scale of the document being drawn, which is handed along
+#   rather than stored. Nothing is kept in module globals, so converters can run
+#   side by side in threads and other programs can import vulture and use one:
+#
+#       converter = vulture.Converter(outMode='ki', scaleFactor=2)
+#       footprint = converter.convert('label.svg')
+#       polygons = converter.polygons('label.svg')
+#
+#   Options are named after the dest of their command line argument and default
+#   to the same values
+#
+
+class Converter:
+
+    def __init__(self, options=None, memo=None, **overrides):
+        settings = vars(argumentParser().parse_args([]))
+        if options is not None:
+            settings.update(vars(options))
+        for name in overrides:
+            if name not in settings:
+                raise TypeError("unknown option '" + name + "'")
+        settings.update(overrides)
+        self.options = argparse.Namespace(**settings)
+        conflict = conflictingOptions(self.options)
+        if conflict is not None:
+            raise ValueError(conflict)
+
+        if memo is None:
+            memo = ShapeMemo()
+            if self.options.shapeCache is not None:
+                memo.load(self.options.shapeCache)
+        self.memo = memo
+
+    # Output text for an svg file, given as a path or an open file
+    def convert(self, source):
+        svg_attributes, paths = readSVG(source)
+        return self.draw(svg_attributes, paths, name=getattr(source, 'name', source))
+
+    # Every polygon of an svg file as a complex array of points in mm, with y
+    # pointing up as in the EAGLE output. Filled shapes are closed and have their
+    # holes spliced in
+    def polygons(self, source):
+        svg_attributes, paths = readSVG(source)
+        scale, exportHeight, placement = self.documentPlacement(svg_attributes)
+        polygons = []
+        for polys in self.pathResults(paths, placement, scale):
+            if polys is not None:
+                polygons.extend(points.real + 1j * (exportHeight - points.imag) for points in polys)
+        return polygons
+
+    # Work out (scale, exportHeight, placement) from the size of the document.
+    # Raises SVGSizeError when it isn't given in mm, cm or in
+    def documentPlacement(self, svg_attributes):
+
+        options = self.options
+
+        svgWidth = 0
+        svgHeight = 0
+        viewportHeight = 0
+        viewportWidth = 0
+
+        # Alert user if there are no height and width tags in the file
+
+        if 'width' not in svg_attributes.keys():
+            raise SVGSizeError("No width/height attributes found. Make sure the svg dimensions are defined in mm or in (not px/pt/pc)")
+
+        # Detect Viewbox dimensions if defined
+
+        if 'viewBox' in svg_attributes.keys():
+            if svg_attributes['viewBox'].split()[2] != '0':
+                viewportWidth = str(
+                    round(float(svg_attributes['viewBox'].split()[2]), 2))
+                viewportHeight = str(
+                    round(float(svg_attributes['viewBox'].split()[3]), 2))
+
+            svgWidth = svg_attributes['width']
+            svgHeight = svg_attributes['height']
+
+        # Convert dimensions to the proper units
+
+        if 'mm' in svgWidth:
+            svgWidth = float(svgWidth.replace('mm', ''))
+            svgHeight = float(svgHeight.replace('mm', ''))
+            viewportWidth = float(viewportWidth)
+            viewportHeight = float(viewportHeight)
+            if options.verbose:
+                print("SVG width detected in mm \\o/", file=sys.stderr)
+        elif 'cm' in svgWidth:
+            svgWidth = float(svgWidth.replace('cm', '')) * 10
+            svgHeight = float(svgHeight.replace('cm', '')) * 10
+            viewportWidth = float(viewportWidth) * 10
+            viewportHeight = float(viewportHeight) * 10
+            if options.verbose:
+                print("SVG width detected in cm", file=sys.stderr)
+        elif 'in' in svgWidth:
+            svgWidth = float(svgWidth.replace('in', '')) * 25.4
+            svgHeight = float(svgHeight.replace('in', '')) * 25.4
+            viewportWidth = float(viewportWidth) * 25.4
+            viewportHeight = float(viewportHeight) * 25.4
+            if options.verbose:
+                print("SVG width detected in inches", file=sys.stderr)
+        else:
+            raise SVGSizeError("SVG height/width not found. Possibly defined in illegal units?")
+
+        # Calculate scale factor (multiply by user-defined scale factor)
+        if viewportWidth != 0:
+            scale = (svgWidth / viewportWidth) * options.scaleFactor
+        else:
+            scale = 1 * options.scaleFactor
+
+        exportHeight = float(svgHeight) * scale
 
         # Another stage of transforms that gets applied to all paths
-        # in order to shift the image around the origin
+        # in order to shift the image around the origin, then scale it to mm
 
         tx = {
             'l':0,
@@ -318,53 +1301,58 @@ def drawSVG(svg_attributes, attributes, paths):
             'c':float(svgHeight)/2,
             'b':0
         }
-        path = elPath(paths[i].d()) * Matrix.translate(tx[args.originPos[1]],ty[args.originPos[0]])
-        path = elPath(path.d())
-
-        style = 0
-
-        if 'style' in attributes[i].keys():
-            style = styleParse(attributes[i]['style'])
-
-        if 'fill' in attributes[i].keys():
-            filled = attributes[i]['fill'] != 'none' and attributes[i]['fill'] != ''
-        elif 'style' in attributes[i].keys():
-            filled = style['fill'] != 'none' and style['fill'] != ''
-        else:
-            filled = False
-
-        if 'stroke' in attributes[i].keys():
-            stroked = attributes[i]['stroke'] != 'none' and attributes[i]['stroke'] != ''
-        elif 'style' in attributes[i].keys():
-            stroked = style['stroke'] != 'none' and style['stroke'] != ''
-        else:
-            stroked = False
-
+        placement = Matrix.translate(tx[options.originPos[1]], ty[options.originPos[0]]) * Matrix.scale(scale)
+
+        return scale, exportHeight, placement
+
+    # pathPolygons for every path in turn, in a process pool with -p
+    def pathResults(self, paths, placement, scale, profile=None):
+        if self.options.reference:
+            return (self.referencePolygons(d, attributes, placement, scale) for d, attributes in paths)
+        if self.options.maxVertices is not None or self.options.footprintVertices is not None:
+            return self.budgetResults(paths, placement, scale, profile)
+        if self.options.pathJobs > 1:
+            return parallelPathPolygons(paths, placement, scale, self.options, self.memo, profile)
+        if profile is not None:
+            paths = profiledPaths(paths, profile)
+        return (self.pathPolygons(d, attributes, placement, scale, profile) for d, attributes in paths)
+
+    # The same polygons the way the original script worked them out: svgelements
+    # finds every sampled point on the transformed path and the pure Python
+    # simplifier runs on lists of points. -f is ignored. It's slow, but it's the
+    # yardstick --check measures the pipeline above against
+    def referencePolygons(self, d, attributes, placement, scale):
+
+        options = self.options
+
+        filled, stroked = pathPaint(attributes)
         if not filled and not stroked:
-            i += 1
-            continue  # not drawable (clip path?)
+            return None
+
+        pathTransform = Matrix()
+        if 'transform' in attributes.keys():
+            pathTransform = Matrix(attributes['transform'])
+        path = elPath(d) * (pathTransform * placement)
+        path.reify()
+        path = elPath(*straightenArcs(path.segments(False)))
 
-        SUBSAMPLING = args.subSampling
-        TRACEWIDTH = str(args.traceWidth)
-        anyVisiblePaths = True
-        l = path.length()
-        divs = round(l * SUBSAMPLING)
+        l = path.length() / scale
+        divs = round(l * options.subSampling)
         if divs < 3:
             divs = 3
-        maxLen = l * 2 * SCALE / divs
+        maxLen = l * 2 * scale / divs
+
         p = path.point(0)
-        p = complex(p.real * SCALE, p.imag * SCALE)
-        last = p
+        last = complex(p.real, p.imag)
         polys = []
         points = []
         s = 0
         while s <= divs:
             p = path.point(s * 1 / divs)
-            p = complex(p.real * SCALE, p.imag * SCALE)
+            p = complex(p.real, p.imag)
             if dist(p, last) > maxLen:
                 if len(points) > 1:
-                    points = simplify(points, SIMPLIFY, SIMPLIFYHQ)
-                    polys.append(points)
+                    polys.append(simplify(points, SIMPLIFY, SIMPLIFYHQ))
                 points = [p]
             else:
                 points.append(p)
@@ -373,258 +1361,962 @@ def drawSVG(svg_attributes, attributes, paths):
             s += 1
 
         if len(points) > 1:
-            points = simplify(points, SIMPLIFY, SIMPLIFYHQ)          
-            polys.append(points)
+            polys.append(simplify(points, SIMPLIFY, SIMPLIFYHQ))
 
         if filled:
-            polys = unpackPoly(polys)
+            polys = referenceUnpackPoly(polys, options.traceWidth, options.verbose)
 
+        finalPolys = []
         for points in polys:
-
             if len(points) < 2:
-                return
-                
-            scriptLine = ''
+                continue
             if filled:
-                points.append(points[0]) # re-add final point so we loop around
+                points.append(points[0])  # re-add final point so we loop around
+            finalPolys.append(np.array(points, dtype=complex))
+        return finalPolys
+
+    # Convert an svg file with the reference pipeline and with this converter's
+    # own, and compare the results path by path. Returns a record for every path
+    # either of them draws. A path matches when no point of either outline is
+    # further than tolerance mm from the other one, and for filled paths when the
+    # spliced polygons are as close, bridges aside, and the areas differ by no
+    # more than a band of that width along the outline would. The outlines are
+    # the same paths drawn as strokes, before any hole is spliced in
+    def check(self, imagePath, tolerance):
+        reference = Converter(self.options, ShapeMemo(), reference=True, pathJobs=1,
+                              profile=None, shapeCache=None)
+
+        svg_attributes, paths = readSVG(imagePath)
+        paths = list(paths)
+        outlines = [(d, dict(attributes, fill='none', stroke='black')) for d, attributes in paths]
+        scale, exportHeight, placement = self.documentPlacement(svg_attributes)
+        results = zip(paths,
+                      reference.pathResults(paths, placement, scale), self.pathResults(paths, placement, scale),
+                      reference.pathResults(outlines, placement, scale), self.pathResults(outlines, placement, scale))
+
+        records = []
+        for i, ((d, attributes), expected, actual, expectedOutline, actualOutline) in enumerate(results):
+            if expected is None and actual is None:
+                continue
+            filled = pathPaint(attributes)[0]
+            hausdorff, splicedDistance, areaDifference, outline = comparePolygons(
+                expected or [], actual or [], expectedOutline or [], actualOutline or [], tolerance, filled)
+            records.append({
+                'path': i + 1,
+                'id': attributes.get('id'),
+                'hausdorff': hausdorff,
+                'splicedDistance': splicedDistance,
+                'areaDifference': areaDifference,
+                'outline': outline,
+                'match': hausdorff <= tolerance and (not filled or (splicedDistance <= tolerance and
+                                                                    areaDifference <= tolerance * outline)),
+            })
+        return records
+
+    # Turn one path into the polygons to emit: complex arrays of points in mm, closed
+    # for filled shapes. Returns None if the path has neither fill nor stroke
+    def pathPolygons(self, d, attributes, placement, scale, profile=None):
+
+        options = self.options
+
+        filled, stroked = pathPaint(attributes)
+        if not filled and not stroked:
+            return None
 
-            if args.outMode != "lib":
+        if profile is not None:
+            profile.note('filled', filled)
 
-                if args.outMode == "b":
-                    scriptLine += "polygon " + args.signalName + " " + TRACEWIDTH + "mm "
+        m = self.pathMatrix(attributes, placement)
+        offset = complex(m.e, m.f)
 
-                if args.outMode == "ls":
-                    scriptLine += "polygon " + TRACEWIDTH + "mm "
+        # the trace width sets how far the hole splices are recessed
+        key = (normalizePathD(d), filled, m.a, m.b, m.c, m.d, scale,
+               options.subSampling, options.flatness, options.traceWidth)
+        polys = self.memo.get(key)
+        if profile is not None:
+            profile.note('memoHit', polys is not None)
+        if polys is not None:
+            return [points + offset for points in polys]
 
-                if args.outMode.find("ki") == -1:
-                    for p in points:
-                        precisionX = '{0:.2f}'.format(round(p.real, 6))
-                        precisionY = '{0:.2f}'.format(round(exportHeight - p.imag, 6))
-                        scriptLine += '(' + precisionX + 'mm ' + precisionY + 'mm) '
+        subpaths = self.sampleSubpaths(d, m, scale, profile)
 
-                    scriptLine += ';'
+        with profileStage(profile, 'simplify', verticesIn=sum(len(points) for points in subpaths)) as counts:
+            polys = []
+            for points in subpaths:
+                if len(points) > 1:
+                    polys.append(Ring(simplifyNp(points, SIMPLIFY, SIMPLIFYHQ)))
+            counts['verticesOut'] = sum(len(points) for points in polys)
 
-                elif args.outMode.find("ki") != -1:
-                    scriptLine += " (fp_poly (pts"
-                    for p in points:
-                        precisionX = "{0:.2f}".format(round(p.real, 6))
-                        precisionY = "{0:.2f}".format(round(p.imag - exportHeight, 6))
-                        scriptLine += " (xy " + precisionX + " " + precisionY + ")"
+        if filled:
+            with profileStage(profile, 'unpack', verticesIn=counts['verticesOut']) as counts:
+                polys = unpackPoly(polys, options.traceWidth, options.verbose)
+                counts['verticesOut'] = sum(len(points) for points in polys)
+
+        finalPolys = finishPolys(polys, filled)
+
+        self.memo.put(key, finalPolys)
+        return [points + offset for points in finalPolys]
+
+    # Everything that moves the points of a path ends up in a single matrix: the
+    # transform from this svg object, the shift around the origin and the scale to
+    # mm. Its linear part is applied to the segment control points once, so all
+    # the sampling already happens in mm. The translation is added at the very
+    # end, which lets copies of a shape that only sit somewhere else share the work
+    def pathMatrix(self, attributes, placement):
+        pathTransform = Matrix()
+        if 'transform' in attributes.keys():
+            pathTransform = Matrix(attributes['transform'])
+            if self.options.verbose:
+                print('...Applying Transforms', file=sys.stderr)
+        return pathTransform * placement
+
+    # The points along a path in mm, without the translation of m, as one complex
+    # array per subpath
+    def sampleSubpaths(self, d, m, scale, profile=None):
+
+        options = self.options
+
+        with profileStage(profile, 'transform') as counts:
+            path = elPath(d) * Matrix(m.a, m.b, m.c, m.d, 0, 0)
+            path.reify()
+
+            segments = straightenArcs(path.segments(False))
+            counts['segmentsOut'] = len(segments)
+
+        if options.flatness:
+            with profileStage(profile, 'sample', segmentsIn=len(segments)) as counts:
+                subpaths = flattenPath(segments, options.flatness)
+                counts['verticesOut'] = sum(len(points) for points in subpaths)
+        else:
+            with profileStage(profile, 'length', segmentsIn=len(segments)):
+                lengths = segmentLengths(segments)
+            # back to svg units so -u keeps meaning points per unit of the drawing
+            l = lengths.sum() / scale
+            divs = round(l * options.subSampling)
+            if divs < 3:
+                divs = 3
+            maxLen = l * 2 * scale / divs
+
+            # sample the whole path in one go, then cut it where it jumps between subpaths
+            with profileStage(profile, 'sample', segmentsIn=len(segments)) as counts:
+                sampled = samplePath(segments, lengths, np.arange(divs + 1) / divs)
+                subpaths = splitSubpaths(sampled, maxLen)
+                counts['verticesOut'] = len(sampled)
+
+        return subpaths
+
+    # pathPolygons for every path, with each polygon simplified just enough to
+    # fit --max-vertices and the whole document to fit --max-footprint-vertices.
+    # A polygon is an outline together with the holes spliced into it, or a
+    # single ring of a stroke. Each ring is ranked once by simplifyImportance(),
+    # after that any tolerance is a comparison. How far every polygon was
+    # simplified and how far its points moved is reported on stderr. A footprint
+    # budget depends on every path, so they're all sampled before the first one
+    # comes out
+    def budgetResults(self, paths, placement, scale, profile=None):
+
+        options = self.options
+
+        if profile is not None:
+            paths = profiledPaths(paths, profile)
+        sampled = (self.budgetPolygons(d, attributes, placement, scale, profile) for d, attributes in paths)
+        floor = SIMPLIFY
+        if options.footprintVertices is not None:
+            sampled = list(sampled)
+            floor = footprintTolerance([path for path in sampled if path is not None],
+                                       options.footprintVertices)
+
+        total = 0
+        totalPlanned = 0
+        worst = 0.0
+        for i, path in enumerate(sampled):
+            if path is None:
+                yield None
+                continue
+            filled, offset, polygons, record = path
+            if profile is not None:
+                profile.current = record  # the footprint budget sampled every path before this one
+
+            polys = []
+            for j, (rings, tolerance) in enumerate(polygons):
+                with profileStage(profile, 'simplify', verticesIn=sum(len(points) for points, _ in rings)) as counts:
+                    tolerance = max(tolerance, floor)
+                    capped = options.maxError is not None and tolerance > options.maxError
+                    if capped:
+                        tolerance = options.maxError
+                    kept = []
+                    error = 0.0
+                    for points, importance in rings:
+                        keep = importance > tolerance
+                        error = max(error, simplifyError(points, keep))
+                        kept.append(Ring(points[keep]))
+                    counts['verticesOut'] = sum(len(ring) for ring in kept)
+                worst = max(worst, error)
+                degenerate = any(vertexCount(ring.points, filled) < 3 for ring in kept)
+                # what the budget has to allow for, even if a collapsed hole doesn't get spliced in
+                planned = sum(vertexCount(ring.points, filled) for ring in kept) + bridgeVertices(len(kept), filled)
+
+                if filled:
+                    # the holes go into the outline they were grouped with, however far
+                    # the budget has moved them
+                    with profileStage(profile, 'unpack', verticesIn=counts['verticesOut']) as counts:
+                        kept = [ring.reversed() if ring.area > 0 else ring for ring in kept]
+                        kept = [spliceHoles(kept, 0, range(1, len(kept)), options.traceWidth, options.verbose)]
+                        counts['verticesOut'] = sum(len(points) for points in kept)
+                kept = finishPolys(kept, filled)
+                vertices = sum(vertexCount(points, filled) for points in kept)
+                total += vertices
+                totalPlanned += max(planned, vertices)
+                polys.extend(kept)
+
+                notes = ''
+                if capped:
+                    notes += ' (over budget, held to --max-error)'
+                elif options.maxVertices is not None and max(planned, vertices) > options.maxVertices:
+                    notes += ' (over budget, every ring keeps at least 3)'
+                if degenerate:
+                    # only a ring that never had three vertices gets here
+                    notes += ' (degenerate ring, fewer than 3 vertices)'
+                sys.stderr.write('path {} polygon {}: {} of {} vertices in {} ring{}, tolerance {:.6f} mm, '
+                                 'error {:.6f} mm{}\n'.format(
+                                     i + 1, j + 1, vertices, sum(vertexCount(points, filled) for points, _ in rings),
+                                     len(rings), '' if len(rings) == 1 else 's', tolerance, error, notes))
+
+            yield [points + offset for points in polys]
+
+        budget = ''
+        if options.footprintVertices is not None:
+            budget = ' of ' + str(options.footprintVertices)
+            if totalPlanned > options.footprintVertices:
+                budget += ' (over budget, every ring keeps at least 3)'
+        sys.stderr.write('{} vertices{}, largest error {:.6f} mm\n'.format(total, budget, worst))
+
+    # (filled, offset, polygons, record) for a path in budget mode, or None if it
+    # isn't drawn. Every polygon is (rings, tolerance), the rings being
+    # (points, importance) and the tolerance the smallest that fits the polygon
+    # into --max-vertices. record is the path's profile record, if there's a profile
+    def budgetPolygons(self, d, attributes, placement, scale, profile=None):
+
+        options = self.options
+
+        filled, stroked = pathPaint(attributes)
+        if not filled and not stroked:
+            return None
 
-                    if args.outMode == "ki":
-                        scriptLine += ") (layer \"F.SilkS\") (width 0.01) (fill solid))\n"
-                    elif args.outMode == "ki5":
-                        scriptLine += ") (layer \"F.SilkS\") (width 0.01))\n"
-            else:
+        if profile is not None:
+            profile.note('filled', filled)
 
-                scriptLine += "<polygon width=\"" + TRACEWIDTH + "\" layer=\"" + str(args.eagleLayerNumber) + "\">\n"
+        m = self.pathMatrix(attributes, placement)
+        subpaths = self.sampleSubpaths(d, m, scale, profile)
 
-                for p in points:
-                    precisionX = '{0:.2f}'.format(round(p.real, 6))
-                    precisionY = '{0:.2f}'.format(round(exportHeight - p.imag, 6))
-                    scriptLine += "<vertex x=\"" + precisionX + "\" y=\"" + precisionY + "\"/>\n"
+        # ranking the points is the simplifying, picking a tolerance comes later
+        with profileStage(profile, 'simplify', verticesIn=sum(len(points) for points in subpaths)):
+            rings = []
+            for points in subpaths:
+                if len(points) > 1:
+                    if not SIMPLIFYHQ:
+                        points = simplifyRadialDistNp(points, SIMPLIFY * SIMPLIFY)
+                    rings.append((points, rankRing(points, filled)))
+
+            polygons = []
+            for group in polygonGroups(rings, filled):
+                members = [rings[r] for r in group]
+                tolerance = SIMPLIFY
+                if options.maxVertices is not None:
+                    tolerance = budgetTolerance([distinctImportance(points, importance, filled)
+                                                 for points, importance in members],
+                                                options.maxVertices, bridgeVertices(len(members), filled))
+                polygons.append((members, tolerance))
+        return filled, complex(m.e, m.f), polygons, (profile.current if profile is not None else None)
+
+    # Write the output for a parsed svg to out, or return it as a string. name is
+    # what the document is called in the --profile record
+    def draw(self, svg_attributes, paths, out=None, name=None):
+
+        options = self.options
+        scale, exportHeight, placement = self.documentPlacement(svg_attributes)
+
+        profile = None
+        if options.profile is not None:
+            profile = Profile()
+            startedTracing = options.profileMemory and not tracemalloc.is_tracing()
+            if startedTracing:
+                tracemalloc.start()
+            start = time.perf_counter()
+
+        # Write straight to the output if we have one, otherwise collect a string
+        collect = out is None
+        if collect:
+            out = io.StringIO()
+        emitter = EMITTERS[options.outMode](out, exportHeight, options)
+        emitter.begin()
+
+        anyVisiblePaths = False
+
+        # paths are streamed from the file, so there's no total count up front
+        i = 0
+        for polys in self.pathResults(paths, placement, scale, profile):
+            i += 1
 
-                scriptLine += "</polygon>"
+            if options.verbose:
+                print('Translating Path ' + str(i), file=sys.stderr)
+
+            if polys is None:
+                continue  # not drawable (clip path?)
+
+            anyVisiblePaths = True
+
+            for points in polys:
+                with profileStage(profile, 'emit', verticesIn=len(points)) as counts:
+                    written = emitter.vertexCount
+                    emitter.polygon(points)
+                    counts['verticesOut'] = emitter.vertexCount - written
+
+        if options.shapeCache is not None:
+            self.memo.save(options.shapeCache)
+        if options.verbose:
+            print(self.memo.stats(), file=sys.stderr)
+
+        if i == 0:
+            print("No paths found. Did you use 'Object to path' in Inkscape?", file=sys.stderr)
+        if not anyVisiblePaths:
+            print("No paths with fills or strokes found.", file=sys.stderr)
+
+        emitter.end()
+
+        if profile is not None:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+            if startedTracing:
+                tracemalloc.stop()
+            record = {
+                'file': name,
+                'options': {option: getattr(options, option) for option in CACHE_OPTIONS + ('pathJobs',)},
+                'seconds': seconds,
+                'peakBytes': peak,
+                'paths': i,
+                # counted from the path records, with -p the memo lookups happen in the workers
+                'memo': {'hits': sum(record.get('memoHit') is True for record in profile.paths),
+                         'misses': sum(record.get('memoHit') is False for record in profile.paths)},
+                'stages': {stage: profile.stages[stage] for stage in PROFILE_STAGES if stage in profile.stages},
+                'pathStages': profile.paths,
+            }
+            # one line per document, -j workers append to the same file
+            with open(options.profile, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+        if collect:
+            return out.getvalue()
+
+
+# The command line's way in: a Converter with the parsed options. An svg that
+# can't be sized is reported and ends the run
+def drawSVG(options, svg_attributes, paths, out=None, name=None):
+    try:
+        return Converter(options, shapeMemo(options)).draw(svg_attributes, paths, out, name)
+    except SVGSizeError as err:
+        print(err, file=sys.stderr)
+        exit()
 
-            out += scriptLine + '\n'
 
-        i += 1
+# ******************************************************************************
+#
+#   Differential check
+#
+#   --check converts every file twice, with Converter.referencePolygons() and
+#   with the pipeline the other options select, and compares the two as shapes
+#   instead of as text. Point order, splice positions and the number of vertices
+#   can all change without changing the footprint that gets made.
+#
 
-    if not anyVisiblePaths:
-        print("No paths with fills or strokes found.")
+# All the edges of a set of polylines cut into pieces no longer than step,
+# as a single array of points
+def densifyPolys(polys, step):
+    pieces = []
+    for points in polys:
+        points = np.asarray(points, dtype=complex)
+        if len(points) < 2:
+            pieces.append(points)
+            continue
+        edges = np.diff(points)
+        n = np.maximum(1, np.ceil(np.abs(edges) / step)).astype(int)
+        edge = np.repeat(np.arange(len(edges)), n)
+        t = (np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)) / n[edge]
+        pieces.append(points[edge] + edges[edge] * t)
+        pieces.append(points[-1:])
+    if not pieces:
+        return np.empty(0, dtype=complex)
+    return np.concatenate(pieces)
+
+# Distance from every point of a to the closest point of b. Anything closer
+# than cell is found through a grid over b. The points that have nothing of b
+# in their own or a neighbouring cell go round again with cells four times the
+# size, until there are few enough of them to measure against all of b. That
+# round only keeps a point of b per cell, which puts distances over cell off by
+# at most the diagonal of a cell. Without exact they're left at something over
+# cell
+def nearestDistances(a, b, cell, exact=True):
+    if len(b) == 0:
+        return np.full(len(a), np.inf)
+    origin = complex(b.real.min(), b.imag.min())
+
+    def cellKeys(points):
+        cx = np.clip(np.floor((points.real - origin.real) / cell), -2**30, 2**30).astype(np.int64)
+        cy = np.clip(np.floor((points.imag - origin.imag) / cell), -2**30, 2**30).astype(np.int64)
+        return cx * 2**32 + cy
+
+    keys = cellKeys(b)
+    order = np.argsort(keys, kind='stable')
+    cells, cellStart, cellCount = np.unique(keys[order], return_index=True, return_counts=True)
+    steps = np.arange(-1, 2, dtype=np.int64)
+    offsets = (steps[:, None] * 2**32 + steps[None, :]).ravel()
+
+    best = np.full(len(a), np.inf)
+    # at most a few million pairs at a time, however full the cells get
+    chunk = max(1, min(65536, 4000000 // (len(offsets) * int(cellCount.max()))))
+    for c in range(0, len(a), chunk):
+        q = np.repeat(np.arange(c, min(c + chunk, len(a))), len(offsets))
+        k = (cellKeys(a[c:c + chunk])[:, None] + offsets[None, :]).ravel()
+        j = np.minimum(np.searchsorted(cells, k), len(cells) - 1)
+        hit = cells[j] == k
+        q = q[hit]
+        j = j[hit]
+        if not len(q):
+            continue
+        counts = cellCount[j]
+        q = np.repeat(q, counts)
+        at = np.repeat(cellStart[j] - (np.cumsum(counts) - counts), counts) + np.arange(len(q))
+        d = np.abs(a[q] - b[order[at]])
+        # pairs arrive grouped by point of a
+        firsts = np.flatnonzero(np.r_[True, q[1:] != q[:-1]])
+        best[q[firsts]] = np.minimum.reduceat(d, firsts)
+
+    if not exact:
+        return best
+    far = np.flatnonzero(best > cell)
+    if len(far) * len(b) > 10**7:
+        best[far] = nearestDistances(a[far], b[order[cellStart]], cell * 4)
+        return best
+    chunk = max(1, 1000000 // len(b))
+    for c in range(0, len(far), chunk):
+        q = far[c:c + chunk]
+        best[q] = np.abs(a[q][:, None] - b[None, :]).min(axis=1)
+    return best
+
+# Filled area of a set of closed polygons. Outlines and the holes spliced into
+# them run in opposite directions, so the holes are taken off by the sum
+def filledArea(polys):
+    area = 0.0
+    for points in polys:
+        points = np.asarray(points, dtype=complex)
+        area += (points[:-1].real * points[1:].imag - points[1:].real * points[:-1].imag).sum() / 2
+    return abs(area)
+
+# How far the points of spliced are from other, leaving out the points of the
+# bridges: those more than step from outline, the polygons spliced was made of.
+# Every point is densified already
+def splicedDistance(spliced, outline, other, step):
+    onOutline = nearestDistances(spliced, outline, step, exact=False) <= step
+    return nearestDistances(spliced[onOutline], other, step).max(initial=0)
+
+# (Hausdorff distance, spliced distance or None, area difference or None,
+# outline length of expected) in mm between two conversions of a path, given as
+# their polygons and their outlines. The bridges holes are spliced in by
+# depend on the exact vertices, so the spliced polygons only have to come as
+# close as the outlines away from them. Everything is cut into pieces of a
+# quarter of the tolerance, which bounds how much the distances can be off by
+def comparePolygons(expected, actual, expectedOutline, actualOutline, tolerance, filled):
+    if filled:
+        # outlines of filled shapes are closed loops
+        expectedOutline = [np.append(points, points[0]) for points in expectedOutline]
+        actualOutline = [np.append(points, points[0]) for points in actualOutline]
+    step = tolerance / 4
+    a = densifyPolys(expectedOutline, step)
+    b = densifyPolys(actualOutline, step)
+    hausdorff = max(nearestDistances(a, b, tolerance).max(initial=0),
+                    nearestDistances(b, a, tolerance).max(initial=0))
+    outline = sum(np.abs(np.diff(points)).sum() for points in expectedOutline)
+    if not filled:
+        return float(hausdorff), None, None, float(outline)
+    splicedA = densifyPolys(expected, step)
+    splicedB = densifyPolys(actual, step)
+    spliced = max(splicedDistance(splicedA, a, splicedB, step), splicedDistance(splicedB, b, splicedA, step))
+    areaDifference = abs(filledArea(expected) - filledArea(actual))
+    return float(hausdorff), float(spliced), float(areaDifference), float(outline)
+
+# The original script's pure Python polygon area, kept for referenceUnpackPoly()
+def polygonArea(poly):
+    area = 0
+    i = 0
+    while i < len(poly):
+        j = (i + 1) % len(poly)
+        area += poly[i].real * poly[j].imag
+        area -= poly[j].real * poly[i].imag
+        i += 1
+    return area / 2
 
-    if args.outMode.find("ki") != -1:
-        out += ')\n'
+# unpackPoly() the way the original script worked, for
+# Converter.referencePolygons(): lists of points, every ring tested against
+# every other with isInside(), the bridge found by trying every pair of points.
+# The original only handled a single level of nesting, here the number of rings
+# around a ring decides: an even count makes an outline, an odd one a hole of
+# the ring around it with one fewer
+def referenceUnpackPoly(poly, traceWidth, verbose=False):
+    # ensure all polys are the right way around
+    if verbose:
+        print('...Unpacking ' + str(len(poly)) + ' Polygons', file=sys.stderr)
+    p = 0
+    while p < len(poly):
+        if polygonArea(poly[p]) > 0:
+            poly[p].reverse()
+            if verbose:
+                print('...Polygon #'+str(p)+' was backwards, reversed', file=sys.stderr)
+        p += 1
 
-    return out
+    around = []
+    for j in range(len(poly)):
+        around.append([k for k in range(len(poly)) if k != j and isInside(poly[j][0], poly[k])])
+
+    finalPolys = []
+    for o in range(len(poly)):
+        if len(around[o]) % 2:
+            continue
+        outerPoly = poly[o]
+        for h in range(len(poly)):
+            if len(around[h]) != len(around[o]) + 1 or o not in around[h]:
+                continue
+            path = poly[h][::-1]  # reverse poly
+            minDist = 10000000000
+            minOuter = 0
+            minPath = 0
+            a = 0
+            while a < len(outerPoly):
+                b = 0
+                while b < len(path):
+                    l = dist(outerPoly[a], path[b])
+                    if l < minDist:
+                        minDist = l
+                        minOuter = a
+                        minPath = b
+                    b += 1
+                a += 1
 
+            # splice the inner poly into the outer poly
+            # but we have to recess the two joins a little
+            # otherwise Eagle reports Invalid poly when filling
+            # the top layer
+            spliced = outerPoly[0:minOuter]
+            stub = interpPt(outerPoly, minOuter, minOuter - 1, traceWidth)
+            if stub is not None:
+                spliced.append(stub)
+            stub = interpPt(path, minPath, minPath + 1, traceWidth)
+            if stub is not None:
+                spliced.append(stub)
+            spliced.extend(path[minPath + 1:])
+            spliced.extend(path[:minPath])
+            stub = interpPt(path, minPath, minPath - 1, traceWidth)
+            if stub is not None:
+                spliced.append(stub)
+            stub = interpPt(outerPoly, minOuter, minOuter + 1, traceWidth)
+            if stub is not None:
+                spliced.append(stub)
+            spliced.extend(outerPoly[minOuter + 1:])
+            outerPoly = spliced
+        finalPolys.append(outerPoly)
+
+    return finalPolys
+
+# Check every file and print the paths that don't match. Returns the number of
+# files with mismatches
+def checkFiles(options, imagePaths, tolerance):
+    converter = Converter(options, shapeMemo(options))
+    failed = 0
+    for imageFile in imagePaths:
+        try:
+            records = converter.check(imageFile, tolerance)
+        except SVGSizeError as err:
+            print(imageFile + ': ' + str(err))
+            failed += 1
+            continue
+
+        mismatches = [record for record in records if not record['match']]
+        worst = max((record['hausdorff'] for record in records), default=0)
+        print('{}: {} paths, {} mismatched, largest distance {:.6f} mm'.format(
+            imageFile, len(records), len(mismatches), worst))
+        for record in mismatches:
+            line = '  path {}{}: distance {:.6f} mm'.format(
+                record['path'], ' (' + record['id'] + ')' if record['id'] else '', record['hausdorff'])
+            if record['areaDifference'] is not None:
+                line += ', spliced {:.6f} mm, area off by {:.6f} mm2 of {:.6f} allowed'.format(
+                    record['splicedDistance'], record['areaDifference'], tolerance * record['outline'])
+            print(line)
+        failed += len(mismatches) > 0
+    return failed
 
-def generate(imagePath):
 
-    path_to_script = os.path.dirname(os.path.abspath(__file__))
+# ******************************************************************************
+#
+#   Conversion cache
+#
+#   drawSVG results stored on disk under a hash of the svg file and of every
+#   option that changes the output, so unchanged artwork isn't converted again
+#
 
-    if args.stdout:
-        paths, attributes, svg_attributes = svg2paths2(imagePath)
-        try:
-            print(drawSVG(svg_attributes, attributes, paths))
-        except:
-            print("Failed to output")
-            sys.exit(0)  # quit Python
+# options that end up in the output, -p/-j/-v/-d only change how or where it's made
+CACHE_OPTIONS = ('scaleFactor', 'subSampling', 'flatness', 'traceWidth', 'originPos',
+                 'outMode', 'eagleLayerNumber', 'signalName', 'reference',
+                 'maxVertices', 'footprintVertices', 'maxError')
 
+class ConversionCache:
 
-    elif args.outMode != 'lib':
-        paths, attributes, svg_attributes = svg2paths2(imagePath)
-        ext = '.scr' if args.outMode.find("ki") == -1 else ".kicad_mod"
+    def __init__(self, directory, maxBytes):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        os.makedirs(directory, exist_ok=True)
 
-        try:
-            f = open(path_to_script + "/" + args.destination + ext, 'w')
-            f.write(drawSVG(svg_attributes, attributes, paths))
-            f.close
+        # entries made by another version of the converter are never handed back
+        self.scriptHash = scriptHash()
 
-        except:
-            print("Failed to create output script file")
-            sys.exit(0)  # quit Python
+    # Hash of the file contents, the options and this script itself
+    def key(self, imagePath, options):
+        h = hashlib.sha256(self.scriptHash)
+        # hashed in pieces, a large svg needn't be held in memory twice
+        with open(imagePath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        h.update(repr([getattr(options, name) for name in CACHE_OPTIONS]).encode())
+        return h.hexdigest()
 
-    else:
-        imagePaths = imagePath.split(",")
-        scripts = []
+    def entryPath(self, key):
+        return os.path.join(self.directory, key + '.txt')
 
-        for imageFile in imagePaths:
-            paths, attributes, svg_attributes = svg2paths2(imageFile)
-            scripts.append(drawSVG(svg_attributes, attributes, paths)) 
+    def contains(self, key):
+        return os.path.exists(self.entryPath(key))
 
+    # Cached output or None. A hit counts as a use for the LRU order
+    def get(self, key):
+        entry = self.entryPath(key)
         try:
-            output_path = path_to_script + "/" + args.destination + ".lbr"
-            
-            labelStrings = []
-            for string in imagePaths:
-                labelStrings.append(os.path.basename(string))
-            
-            if args.writeMode == 'a':
-                new_contents = appendLib(scripts, labelStrings, output_path)
-
-                with open(output_path, 'w') as f:
-                    f.write(new_contents)
+            with open(entry, 'r', encoding='utf-8', newline='') as f:
+                script = f.read()
+            os.utime(entry)
+        except OSError:
+            return None
+        return script
+
+    # Written under a temporary name and renamed, so pool workers sharing the
+    # directory never see half an entry
+    def put(self, key, script):
+        entry = self.entryPath(key)
+        partial = entry + '.' + str(os.getpid()) + '.part'
+        with open(partial, 'w', encoding='utf-8', newline='') as f:
+            f.write(script)
+        os.replace(partial, entry)
+        self.evict()
+
+    # Drop the least recently used entries until the directory fits in maxBytes
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.txt'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # another process just evicted it
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+# The cache picked with --cache, or None
+def openCache(options):
+    if options.cacheDir is None:
+        return None
+    return ConversionCache(options.cacheDir, int(options.cacheSize * 1024 * 1024))
+
+# drawSVG for one file, as a string, through the cache if there is one
+def drawSVGFile(options, imagePath, cache=None):
+    if cache is None:
+        svg_attributes, paths = readSVG(imagePath)
+        return drawSVG(options, svg_attributes, paths, name=imagePath)
+
+    key = cache.key(imagePath, options)
+    script = cache.get(key)
+    if script is None:
+        svg_attributes, paths = readSVG(imagePath)
+        script = drawSVG(options, svg_attributes, paths, name=imagePath)
+        cache.put(key, script)
+    elif options.verbose:
+        print('Reusing cached conversion of ' + imagePath, file=sys.stderr)
+    return script
+
+
+# Convert one svg file into its package contents for lib mode.
+# Returns (script, None) or (None, error message)
+def convertFile(options, imageFile):
+    try:
+        return drawSVGFile(options, imageFile, openCache(options)), None
+    except SystemExit:
+        # drawSVG has already printed why it gave up
+        return None, "conversion aborted"
+    except Exception as err:
+        return None, str(err) or type(err).__name__
+
+WORKER_CONVERTER = None
+
+# The converter -p workers share between the chunks of paths they're handed
+def initWorker(options):
+    global WORKER_CONVERTER
+    WORKER_CONVERTER = Converter(options, shapeMemo(options))
+
+# Convert a list of files, in a process pool if jobs > 1. Results are yielded
+# in the same order as the files either way, as soon as each one is ready
+def convertFiles(options, imageFiles, jobs=1):
+    # cache hits are read quickly enough here, a pool is only worth starting
+    # for the files that still have to be converted
+    cache = openCache(options)
+    if cache is not None and jobs > 1:
+        misses = 0
+        for imageFile in imageFiles:
+            try:
+                misses += not cache.contains(cache.key(imageFile, options))
+            except OSError:
+                misses += 1  # let convertFile report it
+        jobs = min(jobs, misses)
+
+    if jobs > 1 and len(imageFiles) > 1:
+        # pool workers can't start pools of their own, so they handle their paths in turn
+        workerOptions = argparse.Namespace(**dict(vars(options), pathJobs=1))
+        with multiprocessing.Pool(min(jobs, len(imageFiles))) as pool:
+            yield from pool.imap(functools.partial(convertFile, workerOptions), imageFiles)
+    else:
+        for imageFile in imageFiles:
+            yield convertFile(options, imageFile)
 
-            else:
-                f = open(output_path, 'w')
-                f.write(writeLib(scripts, labelStrings))
-                f.close
 
-        except:
-            print("Failed to create output library file")
-            sys.exit(0)  # quit Python       
+# Run the command line with its parsed options
+def generate(options, imagePath):
 
-def writeLib(scriptStrings, labelStrings):
+    loadLibraries()
 
-    head = "<?xml version=\"1.0\" encoding=\"utf-8\"?>\n<!DOCTYPE eagle SYSTEM \"eagle.dtd\">\n<eagle version=\"7.7.0\">\n<drawing>\n<settings>\n<setting alwaysvectorfont=\"no\"/>\n<setting verticaltext=\"up\"/>\n</settings>\n<grid distance=\"1\" unitdist=\"mm\" unit=\"mm\" style=\"lines\" multiple=\"1\" display=\"yes\" altdistance=\"0.1\" altunitdist=\"mm\" altunit=\"mm\"/>\n<layers>\n<layer number=\"1\" name=\"Top\" color=\"4\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"2\" name=\"Route2\" color=\"1\" fill=\"3\" visible=\"no\" active=\"yes\"/>\n<layer number=\"3\" name=\"Route3\" color=\"4\" fill=\"3\" visible=\"no\" active=\"yes\"/>\n<layer number=\"4\" name=\"Route4\" color=\"1\" fill=\"4\" visible=\"no\" active=\"yes\"/>\n<layer number=\"5\" name=\"Route5\" color=\"4\" fill=\"4\" visible=\"no\" active=\"yes\"/>\n<layer number=\"6\" name=\"Route6\" color=\"1\" fill=\"8\" visible=\"no\" active=\"yes\"/>\n<layer number=\"7\" name=\"Route7\" color=\"4\" fill=\"8\" visible=\"no\" active=\"yes\"/>\n<layer number=\"8\" name=\"Route8\" color=\"1\" fill=\"2\" visible=\"no\" active=\"yes\"/>\n<layer number=\"9\" name=\"Route9\" color=\"4\" fill=\"2\" visible=\"no\" active=\"yes\"/>\n<layer number=\"10\" name=\"Route10\" color=\"1\" fill=\"7\" visible=\"no\" active=\"yes\"/>\n<layer number=\"11\" name=\"Route11\" color=\"4\" fill=\"7\" visible=\"no\" active=\"yes\"/>\n<layer number=\"12\" name=\"Route12\" color=\"1\" fill=\"5\" visible=\"no\" active=\"yes\"/>\n<layer number=\"13\" name=\"Route13\" color=\"4\" fill=\"5\" visible=\"no\" active=\"yes\"/>\n<layer number=\"14\" name=\"Route14\" color=\"1\" fill=\"6\" visible=\"no\" active=\"yes\"/>\n<layer number=\"15\" name=\"Route15\" color=\"4\" fill=\"6\" visible=\"no\" active=\"yes\"/>\n<layer number=\"16\" name=\"Bottom\" color=\"1\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"17\" name=\"Pads\" color=\"2\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"18\" name=\"Vias\" color=\"2\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"19\" name=\"Unrouted\" color=\"6\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"20\" name=\"Dimension\" color=\"15\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"21\" name=\"tPlace\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"22\" name=\"bPlace\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"23\" name=\"tOrigins\" color=\"15\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"24\" name=\"bOrigins\" color=\"15\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"25\" name=\"tNames\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"26\" name=\"bNames\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"27\" name=\"tValues\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"28\" name=\"bValues\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"29\" name=\"tStop\" color=\"7\" fill=\"3\" visible=\"no\" active=\"yes\"/>\n<layer number=\"30\" name=\"bStop\" color=\"7\" fill=\"6\" visible=\"no\" active=\"yes\"/>\n<layer number=\"31\" name=\"tCream\" color=\"7\" fill=\"4\" visible=\"no\" active=\"yes\"/>\n<layer number=\"32\" name=\"bCream\" color=\"7\" fill=\"5\" visible=\"no\" active=\"yes\"/>\n<layer number=\"33\" name=\"tFinish\" color=\"6\" fill=\"3\" visible=\"no\" active=\"yes\"/>\n<layer number=\"34\" name=\"bFinish\" color=\"6\" fill=\"6\" visible=\"no\" active=\"yes\"/>\n<layer number=\"35\" name=\"tGlue\" color=\"7\" fill=\"4\" visible=\"no\" active=\"yes\"/>\n<layer number=\"36\" name=\"bGlue\" color=\"7\" fill=\"5\" visible=\"no\" active=\"yes\"/>\n<layer number=\"37\" name=\"tTest\" color=\"7\" fill=\"1\" visible=\"no\" active=\"yes\"/>\n<layer number=\"38\" name=\"bTest\" color=\"7\" fill=\"1\" visible=\"no\" active=\"yes\"/>\n<layer number=\"39\" name=\"tKeepout\" color=\"4\" fill=\"11\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"40\" name=\"bKeepout\" color=\"1\" fill=\"11\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"41\" name=\"tRestrict\" color=\"4\" fill=\"10\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"42\" name=\"bRestrict\" color=\"1\" fill=\"10\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"43\" name=\"vRestrict\" color=\"2\" fill=\"10\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"44\" name=\"Drills\" color=\"7\" fill=\"1\" visible=\"no\" active=\"yes\"/>\n<layer number=\"45\" name=\"Holes\" color=\"7\" fill=\"1\" visible=\"no\" active=\"yes\"/>\n<layer number=\"46\" name=\"Milling\" color=\"3\" fill=\"1\" visible=\"no\" active=\"yes\"/>\n<layer number=\"47\" name=\"Measures\" color=\"7\" fill=\"1\" visible=\"no\" active=\"yes\"/>\n<layer number=\"48\" name=\"Document\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"49\" name=\"Reference\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"51\" name=\"tDocu\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"52\" name=\"bDocu\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"90\" name=\"Modules\" color=\"5\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"91\" name=\"Nets\" color=\"2\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"92\" name=\"Busses\" color=\"1\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"93\" name=\"Pins\" color=\"2\" fill=\"1\" visible=\"no\" active=\"yes\"/>\n<layer number=\"94\" name=\"Symbols\" color=\"4\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"95\" name=\"Names\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"96\" name=\"Values\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"97\" name=\"Info\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"98\" name=\"Guide\" color=\"6\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n</layers>\n"
-    tail = "</drawing>\n</eagle>\n"
-    lbrFile = head + "<library>\n<packages>\n"
-    serialNum = 0
+    if options.checkTolerance is not None:
+        sys.exit(1 if checkFiles(options, imagePath.split(','), options.checkTolerance) else 0)
 
-    # Write Packages
-    for i in range(len(scriptStrings)):
-        lbrFile += "<package name=\"" + cleanName(labelStrings[i].upper()) + str(serialNum) +  "\">\n"
-        lbrFile += scriptStrings[i]
-        lbrFile += "</package>\n"
-        serialNum += 1
-    lbrFile += "</packages>\n<symbols>\n"
+    # every run starts a fresh profile, each converted document adds a line
+    if options.profile is not None:
+        open(options.profile, 'w').close()
 
-    serialNum = 0
+    path_to_script = os.path.dirname(os.path.abspath(__file__))
 
-    # Write Symbols
-    for i in range(len(scriptStrings)):
-        lbrFile += "<symbol name=\"" + cleanName(labelStrings[i].upper()) + str(serialNum) + "\">\n"
-        lbrFile += "<text x=\"0\" y=\"0\" size=\"1.778\" layer=\"94\">" + cleanName(labelStrings[i]) + "</text>\n</symbol>\n"
-        serialNum += 1
-    lbrFile += "</symbols>\n<devicesets>\n"
+    cache = openCache(options)
 
-    serialNum = 0
+    if options.stdout:
+        if cache is None:
+            svg_attributes, paths = readSVG(imagePath)
+        try:
+            if cache is None:
+                drawSVG(options, svg_attributes, paths, sys.stdout, imagePath)
+            else:
+                sys.stdout.write(drawSVGFile(options, imagePath, cache))
+            sys.stdout.write('\n')
+        except:
+            print("Failed to output", file=sys.stderr)
+            sys.exit(0)  # quit Python
 
-    # Write Devicesets
-    for i in range(len(scriptStrings)):
-        lbrFile += "<deviceset name=\"" + cleanName(labelStrings[i].upper()) + str(serialNum) + "\">\n"
-        lbrFile += "<gates>\n<gate name=\"G$1\" symbol=\"" + cleanName(labelStrings[i].upper()) + str(serialNum) + "\" x=\"0\" y=\"0\"/>\n</gates>\n<devices>\n"
-        lbrFile += "<device name=\"\" package=\"" + cleanName(labelStrings[i].upper()) + str(serialNum) + "\">\n<technologies>\n<technology name=\"\"/>\n</technologies>\n</device>\n</devices>\n</deviceset>\n"
-        serialNum += 1
 
-    lbrFile += "</devicesets>\n</library>\n"
-    lbrFile += tail
+    elif options.outMode != 'lib':
+        if cache is None:
+            svg_attributes, paths = readSVG(imagePath)
+        ext = '.scr' if options.outMode.find("ki") == -1 else ".kicad_mod"
 
-    return lbrFile
+        try:
+            output_path = path_to_script + "/" + options.destination + ext
+
+            # the svg is converted as it's read, so the script is only swapped in
+            # once it's complete. A run that fails halfway leaves the old one
+            partial = output_path + '.part'
+            try:
+                with open(partial, 'w') as f:
+                    if cache is None:
+                        drawSVG(options, svg_attributes, paths, f, imagePath)
+                    else:
+                        f.write(drawSVGFile(options, imagePath, cache))
+
+                os.replace(partial, output_path)
+            finally:
+                if os.path.exists(partial):
+                    os.remove(partial)
 
-def appendLib(scriptStrings, labelStrings, file):
+        except:
+            print("Failed to create output script file", file=sys.stderr)
+            sys.exit(0)  # quit Python
 
-    template = "<?xml version=\"1.0\" encoding=\"utf-8\"?>\n<!DOCTYPE eagle SYSTEM \"eagle.dtd\">\n<eagle version=\"7.7.0\">\n<drawing>\n<settings>\n<setting alwaysvectorfont=\"no\"/>\n<setting verticaltext=\"up\"/>\n</settings>\n<grid distance=\"1\" unitdist=\"mm\" unit=\"mm\" style=\"lines\" multiple=\"1\" display=\"yes\" altdistance=\"0.1\" altunitdist=\"mm\" altunit=\"mm\"/>\n<layers>\n<layer number=\"1\" name=\"Top\" color=\"4\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"2\" name=\"Route2\" color=\"1\" fill=\"3\" visible=\"no\" active=\"yes\"/>\n<layer number=\"3\" name=\"Route3\" color=\"4\" fill=\"3\" visible=\"no\" active=\"yes\"/>\n<layer number=\"4\" name=\"Route4\" color=\"1\" fill=\"4\" visible=\"no\" active=\"yes\"/>\n<layer number=\"5\" name=\"Route5\" color=\"4\" fill=\"4\" visible=\"no\" active=\"yes\"/>\n<layer number=\"6\" name=\"Route6\" color=\"1\" fill=\"8\" visible=\"no\" active=\"yes\"/>\n<layer number=\"7\" name=\"Route7\" color=\"4\" fill=\"8\" visible=\"no\" active=\"yes\"/>\n<layer number=\"8\" name=\"Route8\" color=\"1\" fill=\"2\" visible=\"no\" active=\"yes\"/>\n<layer number=\"9\" name=\"Route9\" color=\"4\" fill=\"2\" visible=\"no\" active=\"yes\"/>\n<layer number=\"10\" name=\"Route10\" color=\"1\" fill=\"7\" visible=\"no\" active=\"yes\"/>\n<layer number=\"11\" name=\"Route11\" color=\"4\" fill=\"7\" visible=\"no\" active=\"yes\"/>\n<layer number=\"12\" name=\"Route12\" color=\"1\" fill=\"5\" visible=\"no\" active=\"yes\"/>\n<layer number=\"13\" name=\"Route13\" color=\"4\" fill=\"5\" visible=\"no\" active=\"yes\"/>\n<layer number=\"14\" name=\"Route14\" color=\"1\" fill=\"6\" visible=\"no\" active=\"yes\"/>\n<layer number=\"15\" name=\"Route15\" color=\"4\" fill=\"6\" visible=\"no\" active=\"yes\"/>\n<layer number=\"16\" name=\"Bottom\" color=\"1\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"17\" name=\"Pads\" color=\"2\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"18\" name=\"Vias\" color=\"2\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"19\" name=\"Unrouted\" color=\"6\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"20\" name=\"Dimension\" color=\"15\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"21\" name=\"tPlace\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"22\" name=\"bPlace\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"23\" name=\"tOrigins\" color=\"15\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"24\" name=\"bOrigins\" color=\"15\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"25\" name=\"tNames\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"26\" name=\"bNames\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"27\" name=\"tValues\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"28\" name=\"bValues\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"29\" name=\"tStop\" color=\"7\" fill=\"3\" visible=\"no\" active=\"yes\"/>\n<layer number=\"30\" name=\"bStop\" color=\"7\" fill=\"6\" visible=\"no\" active=\"yes\"/>\n<layer number=\"31\" name=\"tCream\" color=\"7\" fill=\"4\" visible=\"no\" active=\"yes\"/>\n<layer number=\"32\" name=\"bCream\" color=\"7\" fill=\"5\" visible=\"no\" active=\"yes\"/>\n<layer number=\"33\" name=\"tFinish\" color=\"6\" fill=\"3\" visible=\"no\" active=\"yes\"/>\n<layer number=\"34\" name=\"bFinish\" color=\"6\" fill=\"6\" visible=\"no\" active=\"yes\"/>\n<layer number=\"35\" name=\"tGlue\" color=\"7\" fill=\"4\" visible=\"no\" active=\"yes\"/>\n<layer number=\"36\" name=\"bGlue\" color=\"7\" fill=\"5\" visible=\"no\" active=\"yes\"/>\n<layer number=\"37\" name=\"tTest\" color=\"7\" fill=\"1\" visible=\"no\" active=\"yes\"/>\n<layer number=\"38\" name=\"bTest\" color=\"7\" fill=\"1\" visible=\"no\" active=\"yes\"/>\n<layer number=\"39\" name=\"tKeepout\" color=\"4\" fill=\"11\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"40\" name=\"bKeepout\" color=\"1\" fill=\"11\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"41\" name=\"tRestrict\" color=\"4\" fill=\"10\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"42\" name=\"bRestrict\" color=\"1\" fill=\"10\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"43\" name=\"vRestrict\" color=\"2\" fill=\"10\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"44\" name=\"Drills\" color=\"7\" fill=\"1\" visible=\"no\" active=\"yes\"/>\n<layer number=\"45\" name=\"Holes\" color=\"7\" fill=\"1\" visible=\"no\" active=\"yes\"/>\n<layer number=\"46\" name=\"Milling\" color=\"3\" fill=\"1\" visible=\"no\" active=\"yes\"/>\n<layer number=\"47\" name=\"Measures\" color=\"7\" fill=\"1\" visible=\"no\" active=\"yes\"/>\n<layer number=\"48\" name=\"Document\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"49\" name=\"Reference\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"51\" name=\"tDocu\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"52\" name=\"bDocu\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"90\" name=\"Modules\" color=\"5\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"91\" name=\"Nets\" color=\"2\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"92\" name=\"Busses\" color=\"1\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"93\" name=\"Pins\" color=\"2\" fill=\"1\" visible=\"no\" active=\"yes\"/>\n<layer number=\"94\" name=\"Symbols\" color=\"4\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"95\" name=\"Names\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"96\" name=\"Values\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"97\" name=\"Info\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"98\" name=\"Guide\" color=\"6\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n</layers>\n<library>\n<packages>\n</packages>\n<symbols>\n</symbols>\n<devicesets>\n</devicesets>\n</library>\n</drawing>\n</eagle>\n"
-    # end_num_re = re.compile('[0-9]*$')
-    end_num_re = re.compile('(?P<order>[0-9]+)')
+    else:
+        imagePaths = imagePath.split(",")
 
+        try:
+            output_path = path_to_script + "/" + options.destination + ".lbr"
 
-    if os.path.exists(file):
-        tree = XMLET.parse(file)
-        root = tree.getroot()
-    else:
-        root = XMLET.fromstring(template)
+            # written next to the library and only swapped in once it's complete,
+            # so a run that fails halfway leaves the old library as it was
+            partial = output_path + '.part'
+            try:
+                if options.writeMode == 'a':
+                    packages = list(convertedPackages(options, imagePaths))
+                    new_contents = appendLib([script for _, script in packages],
+                                             [label for label, _ in packages], output_path)
 
-    lastSerialNum = None
-    
-    # find out what serial number to use at the beginning
-    symbols = next(root.iter('symbols'))
-    for symbol in symbols:
-        matches = end_num_re.search(symbol.attrib["name"])
-        if matches != None:
-            num = int(matches.group())
-
-            if lastSerialNum == None:
-                lastSerialNum = num + 1
-            else:
-                if num >= lastSerialNum:
-                    lastSerialNum = num + 1
-    
-    if lastSerialNum == None:
-        lastSerialNum = 0
+                    with open(partial, 'w') as f:
+                        f.write(new_contents)
 
-    serialNum = lastSerialNum
+                else:
+                    with open(partial, 'w') as f:
+                        writeLib(f, convertedPackages(options, imagePaths))
 
-    # Write Packages
-    packages = next(root.iter('packages'))
-    for i in range(len(scriptStrings)):
-        element = XMLET.SubElement(packages, 'package')
-        element.attrib = {"name" : cleanName(labelStrings[i].upper()) + str(serialNum)}
-        subroot = XMLET.fromstring("<root>" + scriptStrings[i] + "</root>")
-        for subelement in subroot:
-            element.append(subelement)
+                os.replace(partial, output_path)
+            finally:
+                if os.path.exists(partial):
+                    os.remove(partial)
 
-        serialNum += 1
+        except:
+            print("Failed to create output library file", file=sys.stderr)
+            sys.exit(0)  # quit Python       
 
-    serialNum = lastSerialNum
+# (label, script) for every file that converts. A file that fails is reported and
+# left out, the rest of the batch carries on
+def convertedPackages(options, imagePaths):
+    for imageFile, (script, error) in zip(imagePaths, convertFiles(options, imagePaths, options.jobs)):
+        if error is not None:
+            print("Failed to convert " + imageFile + ": " + error, file=sys.stderr)
+            continue
+        yield os.path.basename(imageFile), script
 
-    # Write Symbols
-    symbols = next(root.iter('symbols'))
-    for i in range(len(scriptStrings)):
-        element = XMLET.SubElement(symbols, 'symbol')
-        element.attrib = {"name" : cleanName(labelStrings[i].upper()) + str(serialNum)}
-        subroot = XMLET.fromstring("<root>" + "<text x=\"0\" y=\"0\" size=\"1.778\" layer=\"94\">" + cleanName(labelStrings[i]) + "</text>" + "</root>")
-        for subelement in subroot:
-            element.append(subelement)
+# Write a whole library to out. packages yields (label, script) pairs and is
+# only gone through once, so it can be a generator of conversions still running
+def writeLib(out, packages):
 
-        serialNum += 1
+    head = "<?xml version=\"1.0\" encoding=\"utf-8\"?>\n<!DOCTYPE eagle SYSTEM \"eagle.dtd\">\n<eagle version=\"7.7.0\">\n<drawing>\n<settings>\n<setting alwaysvectorfont=\"no\"/>\n<setting verticaltext=\"up\"/>\n</settings>\n<grid distance=\"1\" unitdist=\"mm\" unit=\"mm\" style=\"lines\" multiple=\"1\" display=\"yes\" altdistance=\"0.1\" altunitdist=\"mm\" altunit=\"mm\"/>\n<layers>\n<layer number=\"1\" name=\"Top\" color=\"4\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"2\" name=\"Route2\" color=\"1\" fill=\"3\" visible=\"no\" active=\"yes\"/>\n<layer number=\"3\" name=\"Route3\" color=\"4\" fill=\"3\" visible=\"no\" active=\"yes\"/>\n<layer number=\"4\" name=\"Route4\" color=\"1\" fill=\"4\" visible=\"no\" active=\"yes\"/>\n<layer number=\"5\" name=\"Route5\" color=\"4\" fill=\"4\" visible=\"no\" active=\"yes\"/>\n<layer number=\"6\" name=\"Route6\" color=\"1\" fill=\"8\" visible=\"no\" active=\"yes\"/>\n<layer number=\"7\" name=\"Route7\" color=\"4\" fill=\"8\" visible=\"no\" active=\"yes\"/>\n<layer number=\"8\" name=\"Route8\" color=\"1\" fill=\"2\" visible=\"no\" active=\"yes\"/>\n<layer number=\"9\" name=\"Route9\" color=\"4\" fill=\"2\" visible=\"no\" active=\"yes\"/>\n<layer number=\"10\" name=\"Route10\" color=\"1\" fill=\"7\" visible=\"no\" active=\"yes\"/>\n<layer number=\"11\" name=\"Route11\" color=\"4\" fill=\"7\" visible=\"no\" active=\"yes\"/>\n<layer number=\"12\" name=\"Route12\" color=\"1\" fill=\"5\" visible=\"no\" active=\"yes\"/>\n<layer number=\"13\" name=\"Route13\" color=\"4\" fill=\"5\" visible=\"no\" active=\"yes\"/>\n<layer number=\"14\" name=\"Route14\" color=\"1\" fill=\"6\" visible=\"no\" active=\"yes\"/>\n<layer number=\"15\" name=\"Route15\" color=\"4\" fill=\"6\" visible=\"no\" active=\"yes\"/>\n<layer number=\"16\" name=\"Bottom\" color=\"1\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"17\" name=\"Pads\" color=\"2\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"18\" name=\"Vias\" color=\"2\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"19\" name=\"Unrouted\" color=\"6\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"20\" name=\"Dimension\" color=\"15\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"21\" name=\"tPlace\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"22\" name=\"bPlace\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"23\" name=\"tOrigins\" color=\"15\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"24\" name=\"bOrigins\" color=\"15\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"25\" name=\"tNames\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"26\" name=\"bNames\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"27\" name=\"tValues\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"28\" name=\"bValues\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"29\" name=\"tStop\" color=\"7\" fill=\"3\" visible=\"no\" active=\"yes\"/>\n<layer number=\"30\" name=\"bStop\" color=\"7\" fill=\"6\" visible=\"no\" active=\"yes\"/>\n<layer number=\"31\" name=\"tCream\" color=\"7\" fill=\"4\" visible=\"no\" active=\"yes\"/>\n<layer number=\"32\" name=\"bCream\" color=\"7\" fill=\"5\" visible=\"no\" active=\"yes\"/>\n<layer number=\"33\" name=\"tFinish\" color=\"6\" fill=\"3\" visible=\"no\" active=\"yes\"/>\n<layer number=\"34\" name=\"bFinish\" color=\"6\" fill=\"6\" visible=\"no\" active=\"yes\"/>\n<layer number=\"35\" name=\"tGlue\" color=\"7\" fill=\"4\" visible=\"no\" active=\"yes\"/>\n<layer number=\"36\" name=\"bGlue\" color=\"7\" fill=\"5\" visible=\"no\" active=\"yes\"/>\n<layer number=\"37\" name=\"tTest\" color=\"7\" fill=\"1\" visible=\"no\" active=\"yes\"/>\n<layer number=\"38\" name=\"bTest\" color=\"7\" fill=\"1\" visible=\"no\" active=\"yes\"/>\n<layer number=\"39\" name=\"tKeepout\" color=\"4\" fill=\"11\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"40\" name=\"bKeepout\" color=\"1\" fill=\"11\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"41\" name=\"tRestrict\" color=\"4\" fill=\"10\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"42\" name=\"bRestrict\" color=\"1\" fill=\"10\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"43\" name=\"vRestrict\" color=\"2\" fill=\"10\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"44\" name=\"Drills\" color=\"7\" fill=\"1\" visible=\"no\" active=\"yes\"/>\n<layer number=\"45\" name=\"Holes\" color=\"7\" fill=\"1\" visible=\"no\" active=\"yes\"/>\n<layer number=\"46\" name=\"Milling\" color=\"3\" fill=\"1\" visible=\"no\" active=\"yes\"/>\n<layer number=\"47\" name=\"Measures\" color=\"7\" fill=\"1\" visible=\"no\" active=\"yes\"/>\n<layer number=\"48\" name=\"Document\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"49\" name=\"Reference\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"51\" name=\"tDocu\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"52\" name=\"bDocu\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"90\" name=\"Modules\" color=\"5\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"91\" name=\"Nets\" color=\"2\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"92\" name=\"Busses\" color=\"1\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"93\" name=\"Pins\" color=\"2\" fill=\"1\" visible=\"no\" active=\"yes\"/>\n<layer number=\"94\" name=\"Symbols\" color=\"4\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"95\" name=\"Names\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"96\" name=\"Values\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"97\" name=\"Info\" color=\"7\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n<layer number=\"98\" name=\"Guide\" color=\"6\" fill=\"1\" visible=\"yes\" active=\"yes\"/>\n</layers>\n"
+    tail = "</drawing>\n</eagle>\n"
+    out.write(head + "<library>\n<packages>\n")
+
+    # Write Packages, each one as soon as it's converted. Only the names are kept
+    # for the symbols and devicesets that follow
+    names = []
+    labels = []
+    for label, script in packages:
+        name = cleanName(label.upper()) + str(len(names))
+        out.write(packageEntry(name, script))
+        names.append(name)
+        labels.append(label)
+    out.write("</packages>\n<symbols>\n")
 
-    serialNum = lastSerialNum
+    # Write Symbols
+    for name, label in zip(names, labels):
+        out.write(symbolEntry(name, label))
+    out.write("</symbols>\n<devicesets>\n")
 
     # Write Devicesets
-    devicesets = next(root.iter('devicesets'))
-    for i in range(len(scriptStrings)):
-        element = XMLET.SubElement(devicesets, 'deviceset')
-        element.attrib = {"name" : cleanName(labelStrings[i].upper()) + str(serialNum)}
-        subroot = XMLET.fromstring("<root>" + "<gates>\n<gate name=\"G$1\" symbol=\"" + cleanName(labelStrings[i].upper()) + str(serialNum) + "\" x=\"0\" y=\"0\"/>\n</gates>\n<devices>\n<device name=\"\" package=\"" + cleanName(labelStrings[i].upper()) + str(serialNum) + "\">\n<technologies>\n<technology name=\"\"/>\n</technologies>\n</device>\n</devices>\n" + "</root>")
-        for subelement in subroot:
-            # print(subelement)
-            element.append(subelement)
-        
-        serialNum += 1
-
-    # make sure there are newlines after every element
-    # good solution from SO: https://stackoverflow.com/questions/3095434/inserting-newlines-in-xml-file-generated-via-xml-etree-elementtree-in-python/33956544#33956544
-    def indent(elem, level=0):
-        indent_string="" # you can choose various symbols / strings to indent with... use "" for no indentation
-        i = "\n" + level*indent_string
-        if len(elem):
-            if not elem.text or not elem.text.strip():
-                elem.text = i + indent_string
-            if not elem.tail or not elem.tail.strip():
-                elem.tail = i
-            for elem in elem:
-                indent(elem, level+1)
-            if not elem.tail or not elem.tail.strip():
-                elem.tail = i
+    for name in names:
+        out.write(devicesetEntry(name))
+
+    out.write("</devicesets>\n</library>\n")
+    out.write(tail)
+
+# The three entries each label gets in a library
+def packageEntry(name, script):
+    return "<package name=\"" + name + "\">\n" + script + "</package>\n"
+
+def symbolEntry(name, label):
+    return "<symbol name=\"" + name + "\">\n<text x=\"0\" y=\"0\" size=\"1.778\" layer=\"94\">" + cleanName(label) + "</text>\n</symbol>\n"
+
+def devicesetEntry(name):
+    return ("<deviceset name=\"" + name + "\">\n" +
+            "<gates>\n<gate name=\"G$1\" symbol=\"" + name + "\" x=\"0\" y=\"0\"/>\n</gates>\n<devices>\n" +
+            "<device name=\"\" package=\"" + name + "\">\n<technologies>\n<technology name=\"\"/>\n</technologies>\n</device>\n</devices>\n</deviceset>\n")
+
+SYMBOL_NAME_RE = re.compile(r'<symbol\b[^>]*?\bname="([^"]*)"')
+SERIAL_RE = re.compile('[0-9]+')
+
+# One past the highest serial number among the symbols, taking the first run of
+# digits in each name. 0 for a library without numbered symbols
+def nextSerialNum(symbolsText):
+    lastSerialNum = -1
+    for match in SYMBOL_NAME_RE.finditer(symbolsText):
+        num = SERIAL_RE.search(match.group(1))
+        if num is not None:
+            lastSerialNum = max(lastSerialNum, int(num.group()))
+    return lastSerialNum + 1
+
+# Where new children of <tag> go, searched for from offset pos: (start, end, self
+# closing). For <tag>...</tag> that's the span of its contents, for <tag/> the tag
+def librarySection(text, tag, pos):
+    match = re.compile('<' + tag + r'\s*(/?)>').search(text, pos)
+    if match is None:
+        raise ValueError("no <" + tag + "> section in the library")
+    if match.group(1):
+        return match.start(), match.end(), True
+    end = text.find('</' + tag + '>', match.end())
+    if end == -1:
+        raise ValueError("<" + tag + "> is never closed in the library")
+    return match.end(), end, False
+
+# Add a batch of labels to an existing library (or a new one if the file isn't
+# there yet). The library is never parsed as a tree: the packages, symbols and
+# devicesets sections are found in the text and the new entries are spliced in
+# at their ends, so everything already in the file is left as it was
+def appendLib(scriptStrings, labelStrings, file):
+
+    if os.path.exists(file):
+        with open(file, 'r') as f:
+            text = f.read()
+    else:
+        empty = io.StringIO()
+        writeLib(empty, [])
+        text = empty.getvalue()
+
+    library = text.find('<library')
+    if library == -1:
+        raise ValueError("no <library> in " + file)
+
+    sections = []
+    pos = library
+    for tag in ('packages', 'symbols', 'devicesets'):
+        start, end, selfClosing = librarySection(text, tag, pos)
+        sections.append((tag, start, end, selfClosing))
+        pos = end
+
+    _, symbolsStart, symbolsEnd, _ = sections[1]
+    serialNum = nextSerialNum(text[symbolsStart:symbolsEnd])
+    names = [cleanName(label.upper()) + str(serialNum + i) for i, label in enumerate(labelStrings)]
+
+    entries = {
+        'packages': [packageEntry(name, script) for name, script in zip(names, scriptStrings)],
+        'symbols': [symbolEntry(name, label) for name, label in zip(names, labelStrings)],
+        'devicesets': [devicesetEntry(name) for name in names],
+    }
+
+    pieces = []
+    done = 0
+    for tag, start, end, selfClosing in sections:
+        if selfClosing:
+            pieces.append(text[done:start] + '<' + tag + '>\n')
+            pieces.extend(entries[tag])
+            pieces.append('</' + tag + '>')
         else:
-            if level and (not elem.tail or not elem.tail.strip()):
-                elem.tail = i
-    
-    indent(root)
+            pieces.append(text[done:end])
+            if text[end - 1] != '\n':
+                pieces.append('\n')
+            pieces.extend(entries[tag])
+        done = end
+    pieces.append(text[done:])
 
-    return "<?xml version=\"1.0\" encoding=\"utf-8\"?>\n<!DOCTYPE eagle SYSTEM \"eagle.dtd\">\n" + XMLET.tostring(root, encoding='unicode', method='xml')
+    return ''.join(pieces)
 
 def cleanName(name):
 
@@ -747,19 +2439,318 @@ def simplify(points, tolerance, highestQuality):
     points = simplifyDouglasPeucker(points, sqTolerance)
 
     return points
+
 #
 #
 # ******************************************************************************
 #
-#   Main program flow
+#   Array based version of the simplifier above. Points are a complex NumPy
+#   array and the results match the pure Python port vertex for vertex
 #
 
-if __name__ == '__main__':
+# square distance from each point to the matching segment p1-p2 (all arrays)
+def getSqSegDistNp(p, p1, p2):
+
+    x = p1.real
+    y = p1.imag
+    dx = p2.real - x
+    dy = p2.imag - y
+
+    sq = dx * dx + dy * dy
+    nonZero = sq != 0
+    t = np.divide((p.real - x) * dx + (p.imag - y) * dy, sq, out=np.zeros_like(sq), where=nonZero)
+
+    x = np.where(t > 1, p2.real, np.where(t > 0, x + dx * t, x))
+    y = np.where(t > 1, p2.imag, np.where(t > 0, y + dy * t, y))
+
+    dx = p.real - x
+    dy = p.imag - y
+
+    return dx * dx + dy * dy
+
+# basic distance-based simplification
+# Keeping a point depends on the last point kept, so this can't be a single
+# expression, but every run of long steps is accepted in one slice and only
+# clusters of short steps need a (vectorized) search for the next far point
+def simplifyRadialDistNp(points, sqTolerance):
+
+    leng = len(points)
+    if leng < 2:
+        return points
+
+    # like the original port this compares plain distance against sqTolerance
+    def far(a, b):
+        dx = a.real - b.real
+        dy = a.imag - b.imag
+        return np.sqrt(dx * dx + dy * dy) > sqTolerance
+
+    keep = np.zeros(leng, dtype=bool)
+    keep[0] = True
+    shortSteps = np.flatnonzero(~far(points[1:], points[:-1])) + 1
+    prev = 0
+
+    while True:
+        # points reached from a kept point by a long step are kept too
+        s = np.searchsorted(shortSteps, prev + 1)
+        nextShort = shortSteps[s] if s < len(shortSteps) else leng
+        keep[prev + 1:nextShort] = True
+        if nextShort >= leng:
+            prev = leng - 1
+            break
+        prev = nextShort - 1
+
+        # search ahead in growing windows for the first point far enough away
+        start = nextShort + 1
+        window = 16
+        found = None
+        while start < leng:
+            hit = np.flatnonzero(far(points[start:start + window], points[prev]))
+            if len(hit):
+                found = start + hit[0]
+                break
+            start += window
+            window *= 2
+        if found is None:
+            break
+        keep[found] = True
+        prev = found
+
+    if points[prev] != points[-1]:
+        keep[-1] = True
+
+    return points[keep]
+
+# Douglas-Peucker, one NumPy pass per level of the recursion: every open span
+# gets its distances computed together and is split at its farthest point
+def simplifyDouglasPeuckerNp(points, sqTolerance):
+
+    leng = len(points)
+    if leng < 3:
+        return points
+
+    keep = np.zeros(leng, dtype=bool)
+    keep[0] = keep[-1] = True
+    first = np.array([0])
+    last = np.array([leng - 1])
+
+    while len(first):
+        inner = last - first - 1
+        hasInner = inner > 0
+        first = first[hasInner]
+        last = last[hasInner]
+        inner = inner[hasInner]
+        if not len(first):
+            break
+
+        # index of every interior point, grouped by span
+        span = np.repeat(np.arange(len(first)), inner)
+        offsets = np.cumsum(inner) - inner
+        idx = first[span] + 1 + np.arange(len(span)) - offsets[span]
+
+        sqDist = getSqSegDistNp(points[idx], points[first[span]], points[last[span]])
+        maxSqDist = np.maximum.reduceat(sqDist, offsets)
+
+        # first point reaching the maximum, same as the strict > scan
+        atMax = np.flatnonzero(sqDist == maxSqDist[span])
+        _, firstAtMax = np.unique(span[atMax], return_index=True)
+        index = idx[atMax[firstAtMax]]
+
+        split = maxSqDist > sqTolerance
+        keep[index[split]] = True
+        first, last = np.concatenate((first[split], index[split])), np.concatenate((index[split], last[split]))
+
+    return points[keep]
+
+# drop-in for simplify() that works on arrays. Lists in give lists out
+def simplifyNp(points, tolerance, highestQuality):
+
+    asList = not isinstance(points, np.ndarray)
+    points = np.asarray(points, dtype=complex)
+
+    sqTolerance = tolerance * tolerance if tolerance != '' else 1
+
+    points = points if highestQuality else simplifyRadialDistNp(
+        points, sqTolerance)
+
+    points = simplifyDouglasPeuckerNp(points, sqTolerance)
+
+    return points.tolist() if asList else points
+
+# Douglas-Peucker importance of every point: the largest tolerance at which
+# simplifying would still keep it. That's its distance from the span it gets
+# split off, capped by the importance of the split that made the span, so
+# keeping the points above a tolerance gives exactly what
+# simplifyDouglasPeuckerNp() keeps with it. Spans stop being split once their
+# farthest point is within floor, the points left in them get 0. The ends are
+# kept at any tolerance
+def simplifyImportance(points, floor):
+
+    leng = len(points)
+    importance = np.zeros(leng)
+    importance[0] = importance[-1] = np.inf
+    if leng < 3:
+        return importance
+
+    first = np.array([0])
+    last = np.array([leng - 1])
+    cap = np.array([np.inf])
+
+    while len(first):
+        inner = last - first - 1
+        hasInner = inner > 0
+        first = first[hasInner]
+        last = last[hasInner]
+        cap = cap[hasInner]
+        inner = inner[hasInner]
+        if not len(first):
+            break
+
+        span = np.repeat(np.arange(len(first)), inner)
+        offsets = np.cumsum(inner) - inner
+        idx = first[span] + 1 + np.arange(len(span)) - offsets[span]
+
+        sqDist = getSqSegDistNp(points[idx], points[first[span]], points[last[span]])
+        maxSqDist = np.maximum.reduceat(sqDist, offsets)
+
+        atMax = np.flatnonzero(sqDist == maxSqDist[span])
+        _, firstAtMax = np.unique(span[atMax], return_index=True)
+        index = idx[atMax[firstAtMax]]
+
+        split = maxSqDist > floor * floor
+        keep = np.minimum(np.sqrt(maxSqDist[split]), cap[split])
+        importance[index[split]] = keep
+        first, last = np.concatenate((first[split], index[split])), np.concatenate((index[split], last[split]))
+        cap = np.concatenate((keep, keep))
+
+    return importance
+
+# A closed ring ends on the point it starts from, which is kept at any tolerance.
+# Returns the importances of the points that get written as vertices: for a
+# filled ring that repeat isn't one
+def distinctImportance(points, importance, filled):
+    if filled and len(points) > 1 and points[0] == points[-1]:
+        return importance[:-1]
+    return importance
+
+# Uniform sampling rarely lands on the start of a closed subpath again, its
+# last point only comes within a step of the first
+def nearlyClosed(points):
+    return len(points) > 2 and points[0] != points[-1] and \
+        abs(points[-1] - points[0]) <= np.abs(np.diff(points)).max()
+
+# simplifyImportance() for a ring of a budget run, pinned to keep three vertices.
+# A filled ring gets closed when it's written, so when it's nearly closed its
+# last point isn't kept at any tolerance like an end. Dropping it moves the
+# closing edge by no more than its distance from the first point. It's never
+# dropped at SIMPLIFY, where a normal run keeps it
+def rankRing(points, filled):
+    importance = simplifyImportance(points, SIMPLIFY)
+    if filled and nearlyClosed(points):
+        importance[-1] = max(abs(points[-1] - points[0]), np.nextafter(SIMPLIFY, np.inf))
+    return pinRing(points, importance)
+
+# Make the most important of the other points of a ring as permanent as the
+# ones kept at any tolerance, so that none leaves it with fewer than three
+# distinct vertices
+def pinRing(points, importance):
+    permanent = np.count_nonzero(importance == np.inf)
+    if points[0] == points[-1] and importance[0] == importance[-1] == np.inf:
+        permanent -= 1  # one vertex, kept twice
+    others = np.flatnonzero(importance < np.inf)
+    pinned = min(3 - permanent, len(others))
+    if pinned > 0:
+        top = others[np.argpartition(-importance[others], pinned - 1)[:pinned]]
+        importance[top] = np.inf
+    return importance
+
+# The rings of a path that end up in one polygon, as lists of their indices:
+# an outline followed by the holes that get spliced into it in path order, or a
+# single ring of a stroke. Nesting is worked out once, at SIMPLIFY, which no
+# budget goes below, so simplifying further never moves a hole to another
+# outline. The polygons come in the order unpackPoly() writes them in
+def polygonGroups(rings, filled):
+    if not filled:
+        return [[r] for r in range(len(rings))]
+    floorRings = [Ring(points[importance > SIMPLIFY]) for points, importance in rings]
+    parent, depth = nestPolys(floorRings, np.array([abs(ring.area) for ring in floorRings]))
+    groups = {r: [r] for r in range(len(rings)) if depth[r] % 2 == 0}
+    for r in range(len(rings)):
+        if depth[r] % 2:
+            groups[parent[r]].append(r)
+    return sorted(groups.values(), key=min)
+
+# Vertices set aside for the bridges of a polygon of that many rings: the four
+# points a hole is spliced in by, one of them repeating a point of the hole
+def bridgeVertices(rings, filled):
+    return 4 * (rings - 1) if filled else 0
+
+# Smallest tolerance, never below SIMPLIFY, at which the points with these
+# importances come down to at most maxVertices, less reserved set aside. When
+# not even the points that are kept at any tolerance fit, only those are left
+def budgetTolerance(importances, maxVertices, reserved=0):
+    pool = np.concatenate(importances) if importances else np.empty(0)
+    allowed = max(0, maxVertices - reserved)
+    if np.count_nonzero(pool > SIMPLIFY) <= allowed:
+        return SIMPLIFY
+    tolerance = -np.partition(-pool, allowed)[allowed]
+    if tolerance == np.inf:
+        finite = pool[pool < np.inf]
+        tolerance = finite.max() if len(finite) else SIMPLIFY
+    return float(max(tolerance, SIMPLIFY))
+
+# Smallest tolerance that brings every polygon of a document, each already held
+# to its own tolerance, down to maxVertices vertices in total. paths are
+# budgetPolygons() results
+def footprintTolerance(paths, maxVertices):
+    pool = []
+    reserved = 0
+    for filled, offset, polygons, record in paths:
+        for rings, tolerance in polygons:
+            for points, importance in rings:
+                importance = distinctImportance(points, importance, filled)
+                pool.append(importance[importance > tolerance])
+            reserved += bridgeVertices(len(rings), filled)
+    return budgetTolerance(pool, maxVertices, reserved)
+
+# Vertices points is written with: repeats of the point before don't count, nor
+# does the closing point of a filled polygon
+def vertexCount(points, filled):
+    count = np.count_nonzero(points[1:] != points[:-1]) + 1
+    if filled and len(points) > 1 and points[0] == points[-1]:
+        count -= 1
+    return int(count)
+
+# How far the points left out by keep are from the simplified line, in mm
+def simplifyError(points, keep):
+    if not keep[-1]:
+        # a nearly closed ring that lost its last point, which closing it bridges
+        points = np.append(points, points[0])
+        keep = np.append(keep, True)
+    kept = np.flatnonzero(keep)
+    dropped = np.flatnonzero(~keep)
+    if not len(dropped):
+        return 0.0
+    seg = np.searchsorted(kept, dropped) - 1
+    return float(np.sqrt(getSqSegDistNp(points[dropped], points[kept[seg]], points[kept[seg + 1]]).max()))
+#
+#
+# ******************************************************************************
+#
+#   Command line
+#
+
+# Why options can't be used together, for parser.error(), or None if they can
+def conflictingOptions(options):
+    if options.pathJobs > 1 and (options.maxVertices is not None or options.footprintVertices is not None):
+        return '-p can\'t be used with --max-vertices or --max-footprint-vertices'
+    return None
+
+def argumentParser():
 
     parser = argparse.ArgumentParser(
         description='SparkFun Buzzard Label Generator')
 
-    parser.add_argument('imageFile', help='Path to target image file (.svg)')
+    parser.add_argument('imageFile', nargs='?', help='Path to target image file (.svg)')
 
     parser.add_argument('-s', dest='scaleFactor', default=1,
                         type=float, help='Factor by which to scale the size of the imported image (default: 1)')
@@ -779,6 +2770,18 @@ if __name__ == '__main__':
     parser.add_argument('-u', dest='subSampling', default=5,
                         type=float, help='Subsampling Rate, if the imported image is "jagged" try a larger number here (larger values provide smoother curves with more points. default: 5)')  
 
+    parser.add_argument('-f', dest='flatness', default=None,
+                        type=float, help='Adaptive sampling: curves are subdivided until they deviate less than this many mm from a straight line and lines keep only their end points (overrides -u)')
+
+    parser.add_argument('--max-vertices', dest='maxVertices', default=None, type=int,
+                        help='Vertex budget: simplify every polygon, its holes included, just enough to keep at most this many vertices (at least 3 per outline or hole)')
+
+    parser.add_argument('--max-footprint-vertices', dest='footprintVertices', default=None, type=int,
+                        help='Vertex budget for everything in the output together')
+
+    parser.add_argument('--max-error', dest='maxError', default=None, type=float,
+                        help='Never move points further than this many mm to meet a vertex budget, rings that still don\'t fit are reported (default: no limit)')
+
     parser.add_argument('-t', dest='traceWidth', default=0.01,
                         type=float, help='Trace width in mm') 
 
@@ -791,12 +2794,159 @@ if __name__ == '__main__':
     parser.add_argument('-d', dest='destination', default='output',
                     help='Output destination filename (extension depends on -o flag)')
 
+    parser.add_argument('-j', '--jobs', dest='jobs', default=1, type=int,
+                        help='Number of processes used to convert multiple files in library mode (default: 1)')
+
+    parser.add_argument('-p', '--path-jobs', dest='pathJobs', default=1, type=int,
+                        help='Number of processes used to convert the paths of a single file, for very large drawings (default: 1)')
+
+    parser.add_argument('--cache', dest='cacheDir', default=None,
+                        help='Directory where conversions are kept and reused while the svg and options are unchanged (default: no cache)')
+
+    parser.add_argument('--cache-size', dest='cacheSize', default=100, type=float,
+                        help='Size in MB the cache directory is trimmed to, least recently used first (default: 100)')
+
+    parser.add_argument('--shape-cache', dest='shapeCache', default=None,
+                        help='File where converted shapes are kept between runs, so shapes repeated across files are only converted once (default: kept in memory for one run)')
+
+    parser.add_argument('--profile', dest='profile', default=None,
+                        help='Write time, call counts, vertex counts and peak memory of every conversion stage to this file as JSON lines')
+
+    parser.add_argument('--profile-memory', dest='profileMemory', default=False, action='store_true',
+                        help='Add the peak memory of every stage to --profile (much slower)')
+
+    parser.add_argument('--reference', dest='reference', default=False, action='store_true',
+                        help='Convert with the original, much slower pipeline that the faster one is checked against')
+
+    parser.add_argument('--check', dest='checkTolerance', default=None, type=float,
+                        help='Write nothing, but compare the conversion with the --reference one and report every path that differs by more than this many mm (exit status 1 if any do)')
+
+    parser.add_argument('--serve', dest='serve', default=False, action='store_true',
+                        help='Keep running in the background and take conversions from vultureClient.py')
+
     parser.add_argument('-stdout', dest='stdout', default=False, action='store_true',
-                    help='If Specified output is written to stdout')                    
+                    help='If Specified output is written to stdout')
+
+    return parser
+
 
+# ******************************************************************************
+#
+#   Conversion server
+#
+#   vulture.py --serve keeps numpy and svgelements imported between runs. It
+#   listens on a random localhost port, and vultureClient.py finds it (and the
+#   token it has to present) in SERVER_INFO. Each request is the command line and
+#   working directory of one run; the reply is what that run printed and its exit
+#   status. Requests are handled one at a time
+#
+
+SERVER_INFO = os.path.join(os.path.expanduser('~'), '.vulture-server')
+SERVER_IDLE = 30 * 60  # seconds without requests before the server exits
+
+class ConversionServer(socketserver.TCPServer):
+
+    def handle_timeout(self):
+        self.done = True
+
+class ConversionHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            return
+        if request.get('token') != self.server.token:
+            return
+
+        if os.path.getmtime(__file__) != self.server.scriptTime:
+            # vulture.py was changed since this server started, the client
+            # starts a fresh one instead
+            reply = {'stale': True}
+            self.server.done = True
+        else:
+            reply = runRequest(request['argv'], request['cwd'])
+        self.wfile.write(json.dumps(reply).encode() + b'\n')
+
+# One run of the command line, the same as if it were started from cwd
+def runRequest(argv, cwd):
+    output = io.StringIO()
+    errors = io.StringIO()
+    status = 0
+    home = os.getcwd()
+    try:
+        os.chdir(cwd)
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(errors):
+            parser = argumentParser()
+            options = parser.parse_args(argv)
+            if options.serve:
+                parser.error('--serve is only for starting the server')
+            if options.imageFile is None:
+                parser.error('the following arguments are required: imageFile')
+            if conflictingOptions(options) is not None:
+                parser.error(conflictingOptions(options))
+            generate(options, options.imageFile)
+    except SystemExit as err:
+        if isinstance(err.code, int):
+            status = err.code
+        elif err.code is not None:
+            errors.write(str(err.code) + '\n')
+            status = 1
+    except Exception:
+        errors.write(traceback.format_exc())
+        status = 1
+    finally:
+        os.chdir(home)
+
+    return {'output': output.getvalue(), 'errors': errors.getvalue(), 'status': status}
+
+def serve():
+    loadLibraries()  # the whole point of the server
+    server = ConversionServer(('127.0.0.1', 0), ConversionHandler)
+    server.token = secrets.token_hex(16)
+    server.scriptTime = os.path.getmtime(__file__)
+    server.timeout = SERVER_IDLE
+    server.done = False
+
+    # only readable by this user, the token is what keeps other users out
+    info = str(server.server_address[1]) + ' ' + server.token + '\n'
+    partial = SERVER_INFO + '.' + str(os.getpid()) + '.part'
+    fd = os.open(partial, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(info)
+    os.replace(partial, SERVER_INFO)
+
+    try:
+        while not server.done:
+            server.handle_request()
+    finally:
+        server.server_close()
+        try:
+            # a newer server may have taken over the file already
+            with open(SERVER_INFO) as f:
+                if f.read() == info:
+                    os.remove(SERVER_INFO)
+        except OSError:
+            pass
+
+# ******************************************************************************
+#
+#   Main program flow
+#
+
+if __name__ == '__main__':
+
+    parser = argumentParser()
     args = parser.parse_args()
-          
-    generate(args.imageFile)
+
+    if args.serve:
+        serve()
+    elif args.imageFile is None:
+        parser.error('the following arguments are required: imageFile')
+    elif conflictingOptions(args) is not None:
+        parser.error(conflictingOptions(args))
+    else:
+        generate(args, args.imageFile)
 
     #
     # ******************************************************************************
@@ -0,0 +1,86 @@
+#
+#   Thin client for vulture.py
+#
+#   Takes exactly the same arguments as vulture.py, but hands the run to a
+#   vulture.py --serve process that already has its libraries imported, so
+#   starting it costs no more than starting Python. The server is started when
+#   there isn't one yet. If it can't be reached the conversion runs here instead.
+#
+#   Only the standard library is imported here, on purpose.
+#
+
+import json
+import os
+import runpy
+import socket
+import subprocess
+import sys
+import time
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vulture.py')
+SERVER_INFO = os.path.join(os.path.expanduser('~'), '.vulture-server')
+START_TIMEOUT = 30  # seconds to wait for a new server to come up
+
+# (port, token) of the running server, or None
+def readServerInfo():
+    try:
+        with open(SERVER_INFO) as f:
+            port, token = f.read().split()
+        return int(port), token
+    except (OSError, ValueError):
+        return None
+
+# Send one run to the server. Returns its reply, or None if there's nobody there
+def sendRequest(info, argv):
+    port, token = info
+    request = {'token': token, 'argv': argv, 'cwd': os.getcwd()}
+    try:
+        with socket.create_connection(('127.0.0.1', port), timeout=2) as sock:
+            sock.settimeout(None)  # a big conversion can take a while
+            sock.sendall(json.dumps(request).encode() + b'\n')
+            reply = sock.makefile('rb').readline()
+        return json.loads(reply)
+    except (OSError, ValueError):
+        return None
+
+# Start vulture.py --serve on its own and wait until it has said where it is
+def startServer(previous):
+    options = {}
+    if os.name == 'nt':
+        options['creationflags'] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        options['start_new_session'] = True
+    subprocess.Popen([sys.executable, SCRIPT, '--serve'], stdin=subprocess.DEVNULL,
+                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **options)
+
+    deadline = time.time() + START_TIMEOUT
+    while time.time() < deadline:
+        info = readServerInfo()
+        if info is not None and info != previous:
+            return info
+        time.sleep(0.05)
+    return None
+
+def main(argv):
+    info = readServerInfo()
+    reply = None
+    if info is not None:
+        reply = sendRequest(info, argv)
+
+    # nobody listening, or a server still running an older vulture.py
+    if reply is None or reply.get('stale'):
+        info = startServer(info)
+        if info is not None:
+            reply = sendRequest(info, argv)
+
+    if reply is None or reply.get('stale'):
+        sys.argv = [SCRIPT] + argv
+        runpy.run_path(SCRIPT, run_name='__main__')
+        return 0
+
+    sys.stdout.write(reply['output'])
+    sys.stderr.write(reply['errors'])
+    return reply['status']
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))